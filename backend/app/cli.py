@@ -0,0 +1,72 @@
+"""
+Maintenance commands, run from the backend directory:
+
+    python -m app.cli backfill-features [--workers N] [--all]
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.database.connection import init_db
+from app.database.repository import SongRepository
+from app.services import analysis
+
+logger = logging.getLogger(__name__)
+
+# Analysis results are written to the database in batches of this size
+SAVE_BATCH_SIZE = 100
+
+
+def backfill_features(workers: int, reanalyze: bool = False) -> None:
+    """Analyze every song missing from the feature index, across worker processes."""
+    init_db()
+    songs = SongRepository.get_unanalyzed(reanalyze)
+    logger.info(f"Analyzing {len(songs)} songs with {workers} workers")
+
+    rows = []
+    done = failed = missing = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analysis.analyze_song, song): song for song in songs}
+        for future in as_completed(futures):
+            song = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                logger.error(f"Analysis failed for song {song['id']}: {e}")
+                failed += 1
+                continue
+
+            done += 1
+            if row:
+                rows.append(row)
+            else:
+                missing += 1
+            if len(rows) >= SAVE_BATCH_SIZE:
+                SongRepository.save_features(rows)
+                rows = []
+                logger.info(f"Analyzed {done}/{len(songs)} songs")
+
+    if rows:
+        SongRepository.save_features(rows)
+    logger.info(f"Backfill complete: {done - missing} analyzed, {missing} missing files, {failed} failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-features", help="Analyze songs missing from the feature index")
+    backfill.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    backfill.add_argument("--all", action="store_true", help="Re-analyze every song")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "backfill-features":
+        backfill_features(args.workers, reanalyze=args.all)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,42 @@ from functools import lru_cache
 
 class Settings:
     MODEL_NAME: str = os.getenv("MODEL_NAME", "facebook/musicgen-stereo-large")
+    # "musicgen", or "fake" for synthetic audio without a GPU or checkpoint (load tests, benchmarks)
+    MODEL_BACKEND: str = os.getenv("MODEL_BACKEND", "musicgen")
+    FAKE_STEP_MS: float = float(os.getenv("FAKE_STEP_MS", "10"))  # simulated decode time per token step
+    # Load the model in the background at startup; otherwise on the first generation
+    PRELOAD_MODEL: bool = os.getenv("PRELOAD_MODEL", "true").lower() == "true"
     OUTPUT_DIR: str = os.getenv("OUTPUT_DIR", "/app/output")
     CORS_ORIGINS: str = os.getenv("CORS_ORIGINS", "*")
     DEFAULT_DURATION: int = int(os.getenv("DEFAULT_DURATION", "15"))
-    MAX_DURATION: int = int(os.getenv("MAX_DURATION", "60"))
+    MAX_DURATION: int = int(os.getenv("MAX_DURATION", "600"))
+    CONTINUATION_CONTEXT: int = int(os.getenv("CONTINUATION_CONTEXT", "10"))  # seconds
+    # Longer tracks are generated as chained continuations in windows of this many seconds
+    # (at most the model's own limit), joined with crossfades
+    LONG_FORM_WINDOW: int = int(os.getenv("LONG_FORM_WINDOW", "30"))
+    LONG_FORM_CROSSFADE: float = float(os.getenv("LONG_FORM_CROSSFADE", "1.5"))  # seconds
+    FEATURE_CACHE_SIZE: int = int(os.getenv("FEATURE_CACHE_SIZE", "32"))  # in-memory entries
+    MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "4"))  # clips per model call
+    OUTPUT_WORKERS: int = int(os.getenv("OUTPUT_WORKERS", "4"))  # threads encoding WAV files
+    LOUDNESS_TARGET: float = float(os.getenv("LOUDNESS_TARGET", "-14"))  # LUFS
+    JOB_TTL: int = int(os.getenv("JOB_TTL", "3600"))  # seconds finished jobs are kept
+    # Seconds shutdown waits for the running job and pending file writes
+    SHUTDOWN_TIMEOUT: float = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+    # Target queue wait for interactive jobs, reported by /jobs/stats (seconds)
+    INTERACTIVE_WAIT_SLO: float = float(os.getenv("INTERACTIVE_WAIT_SLO", "30"))
+
+    # Database
+    DB_READERS: int = int(os.getenv("DB_READERS", "4"))  # threads serving reads for request handlers
+    DB_WRITE_BATCH: int = int(os.getenv("DB_WRITE_BATCH", "64"))  # queued writes committed together
+
+    # Startup library validation
+    CLEANUP_ORPHAN_FILES: bool = os.getenv("CLEANUP_ORPHAN_FILES", "false").lower() == "true"
+
+    # Retention (0 disables each limit)
+    STORAGE_BUDGET_MB: int = int(os.getenv("STORAGE_BUDGET_MB", "0"))
+    RETENTION_MAX_AGE_DAYS: int = int(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+    COMPRESS_AFTER_DAYS: int = int(os.getenv("COMPRESS_AFTER_DAYS", "0"))
+    RETENTION_INTERVAL: int = int(os.getenv("RETENTION_INTERVAL", "3600"))  # seconds
 
     # Hugging Face Inference API settings
     HF_API_TOKEN: str = os.getenv("HF_API_TOKEN", "")
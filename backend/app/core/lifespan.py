@@ -1,30 +1,81 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from app.database import init_db, checkpoint_db, SongRepository
-from app.services import musicgen
+from app.config import get_settings
+from app.database import init_db, checkpoint_db, close_db, SongRepository
+from app.services import analysis, jobs, musicgen, retention, similarity, storage
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
 
+async def validate_library() -> None:
+    """Validate songs and clean up orphaned records without blocking startup."""
+    try:
+        await asyncio.to_thread(storage.migrate_flat_layout)
+        result = await asyncio.to_thread(SongRepository.validate_and_cleanup)
+    except Exception as e:
+        logger.error(f"Library validation failed: {e}")
+        return
+
+    if result["skipped"]:
+        logger.info("Library unchanged since last validation, skipped")
+    else:
+        logger.info(
+            f"Validated {result['validated']} songs, removed {result['removed']} orphans, "
+            f"cleared {result['cleared']} missing processed files, "
+            f"found {result['orphan_files']} orphaned files"
+        )
+
+
+async def _start_maintenance(validation: asyncio.Task) -> None:
+    """Build the similarity index and start the retention loop once the library has been validated."""
+    await validation
+    try:
+        await asyncio.to_thread(similarity.sync)
+    except Exception as e:
+        logger.error(f"Similarity index sync failed: {e}")
+    await retention.retention_loop()
+
+
+async def preload_model() -> None:
+    """Load the model off the event loop so startup and the library endpoints don't wait for it."""
+    try:
+        await asyncio.to_thread(musicgen.load_model)
+    except Exception as e:
+        # Generation retries the load on its next request
+        logger.error(f"Model preload failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting The Resonator...")
     init_db()
+    jobs.start()
+    analysis.start()
 
-    # Validate songs and clean up orphaned records
-    result = SongRepository.validate_and_cleanup()
-    logger.info(f"Validated {result['validated']} songs, removed {result['removed']} orphans")
+    validation = asyncio.create_task(validate_library())
+    retention_task = asyncio.create_task(_start_maintenance(validation))
 
-    musicgen.load_model()
+    preload = asyncio.create_task(preload_model()) if settings.PRELOAD_MODEL else None
     logger.info("Startup complete")
 
     yield
 
-    # Shutdown - checkpoint WAL to ensure durability
+    # Shutdown - everything that writes stops before the database closes,
+    # then checkpoint WAL to ensure durability
     logger.info("Shutting down...")
+    retention_task.cancel()
+    await validation
+    await asyncio.to_thread(jobs.shutdown, settings.SHUTDOWN_TIMEOUT)
+    await asyncio.to_thread(analysis.shutdown)
+    if preload:
+        # A load in progress can't be interrupted; don't wait for it
+        preload.cancel()
+    close_db()
     checkpoint_db()
     logger.info("Shutdown complete")
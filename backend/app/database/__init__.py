@@ -1,4 +1,4 @@
-from app.database.connection import get_db, init_db, checkpoint_db
+from app.database.connection import get_db, init_db, checkpoint_db, close_db, backup_db
 from app.database.repository import SongRepository
 
-__all__ = ["get_db", "init_db", "checkpoint_db", "SongRepository"]
+__all__ = ["get_db", "init_db", "checkpoint_db", "close_db", "backup_db", "SongRepository"]
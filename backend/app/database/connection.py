@@ -1,7 +1,13 @@
+import asyncio
+import functools
 import logging
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Optional, TypeVar
 
 from app.config import get_settings
 
@@ -9,9 +15,25 @@ settings = get_settings()
 DB_PATH = Path(settings.OUTPUT_DIR) / "resonator.db"
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+_local = threading.local()
+_readers = ThreadPoolExecutor(max_workers=settings.DB_READERS, thread_name_prefix="db-reader")
+_writes: "queue.Queue[Optional[tuple[Callable, tuple, dict, Future]]]" = queue.Queue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_closed = False
+# Every thread's read connection, so close_db can close them
+_reader_conns: list[sqlite3.Connection] = []
+
 
 def init_db():
     """Initialize database with WAL mode and create tables if they don't exist."""
+    global _closed
+
+    with _writer_lock:
+        _closed = False
+
     # Ensure output directory exists
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
@@ -35,11 +57,55 @@ def init_db():
             );
             CREATE INDEX IF NOT EXISTS idx_songs_created_at ON songs(created_at DESC);
             CREATE INDEX IF NOT EXISTS idx_songs_is_favorite ON songs(is_favorite);
+
+            CREATE TABLE IF NOT EXISTS song_features (
+                song_id INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                bpm REAL,
+                key TEXT,
+                lufs REAL,
+                peak_db REAL,
+                spectral_centroid REAL,
+                sub_bass REAL,
+                analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_song_features_bpm ON song_features(bpm);
+            CREATE INDEX IF NOT EXISTS idx_song_features_key ON song_features(key);
+            CREATE INDEX IF NOT EXISTS idx_song_features_lufs ON song_features(lufs);
+            CREATE INDEX IF NOT EXISTS idx_song_features_centroid ON song_features(spectral_centroid);
+            CREATE INDEX IF NOT EXISTS idx_song_features_sub_bass ON song_features(sub_bass);
+            CREATE TRIGGER IF NOT EXISTS songs_delete_features AFTER DELETE ON songs
+            BEGIN
+                DELETE FROM song_features WHERE song_id = OLD.id;
+            END;
+
+            CREATE TABLE IF NOT EXISTS library_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
         """)
 
+        _add_missing_columns(conn, "songs", {
+            "last_accessed_at": "TIMESTAMP",
+            "content_hash": "TEXT",
+        })
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_content_hash ON songs(content_hash)")
+        _add_missing_columns(conn, "song_features", {
+            "embedding": "BLOB",
+        })
+
     logger.info(f"Database initialized at {DB_PATH}")
 
 
+def _add_missing_columns(conn, table: str, columns: dict[str, str]):
+    """Add columns introduced after a table was first created."""
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            logger.info(f"Added column {table}.{name}")
+
+
 def checkpoint_db():
     """Force WAL checkpoint to ensure all changes are written to main database file."""
     try:
@@ -50,6 +116,19 @@ def checkpoint_db():
         logger.error(f"Database checkpoint failed: {e}")
 
 
+def backup_db(target_path: str) -> None:
+    """
+    Copy a consistent snapshot of the database to a file with SQLite's online
+    backup API. The copy runs in one step as a WAL reader, so writers carry on.
+    """
+    with get_db() as conn:
+        target = sqlite3.connect(target_path)
+        try:
+            conn.backup(target)
+        finally:
+            target.close()
+
+
 @contextmanager
 def get_db():
     """Context manager for database connections."""
@@ -64,3 +143,159 @@ def get_db():
         raise
     finally:
         conn.close()
+
+
+def _connect(check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=10.0, isolation_level=None, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+@contextmanager
+def read_db():
+    """
+    Reuse this thread's read-only connection.
+
+    Reads never wait on writers in WAL mode, so each thread keeps one
+    connection open instead of connecting per query.
+    """
+    conn = getattr(_local, "reader", None)
+    if conn is None or conn not in _reader_conns:
+        # Only used by this thread, but closed by close_db from another
+        conn = _connect(check_same_thread=False)
+        conn.execute("PRAGMA query_only=1")
+        _local.reader = conn
+        with _writer_lock:
+            _reader_conns.append(conn)
+    yield conn
+
+
+def _write_loop() -> None:
+    """
+    Apply queued writes on a single connection with group commit.
+
+    Everything queued when a batch starts (up to DB_WRITE_BATCH writes) shares
+    one transaction and one commit. Each write runs in its own savepoint, so
+    a failing write is rolled back without taking the rest of its batch along.
+    """
+    conn = _connect()
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.writer = conn
+
+    while True:
+        batch = [_writes.get()]
+        while len(batch) < settings.DB_WRITE_BATCH:
+            try:
+                batch.append(_writes.get_nowait())
+            except queue.Empty:
+                break
+
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for item in batch:
+                if item is None:
+                    continue
+                fn, args, kwargs, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write")
+                try:
+                    done.append((future, fn(conn, *args, **kwargs), None))
+                    conn.execute("RELEASE write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    done.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Database write batch failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            # Nothing in the batch committed, including writes it never reached
+            errors = {future: error for future, _, error in done if error}
+            done = []
+            for item in batch:
+                if item is None:
+                    continue
+                future = item[3]
+                if future.running() or future.set_running_or_notify_cancel():
+                    done.append((future, None, errors.get(future) or e))
+
+        # Results are only handed out once they are durable
+        for future, result, error in done:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        if None in batch:
+            conn.close()
+            return
+
+
+def submit_write(fn: Callable[..., T], *args, **kwargs) -> Future:
+    """
+    Queue a write for the writer thread.
+
+    Args:
+        fn: Called as fn(conn, *args, **kwargs) inside the batch transaction
+
+    Returns:
+        Future resolving to fn's result once its batch has committed, or
+        failed straight away if the database has been closed
+    """
+    global _writer
+
+    future: Future = Future()
+    with _writer_lock:
+        if _closed:
+            # Shutting down: don't start a writer that nothing would stop
+            logger.warning(f"Write after the database was closed: {getattr(fn, '__name__', fn)}")
+            future.set_exception(RuntimeError("Database is closed"))
+            return future
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="db-writer", daemon=True)
+            _writer.start()
+        _writes.put((fn, args, kwargs, future))
+    return future
+
+
+def write(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a write on the writer thread and wait for it to commit."""
+    conn = getattr(_local, "writer", None)
+    if conn is not None:
+        # Already inside a write: join its transaction
+        return fn(conn, *args, **kwargs)
+    return submit_write(fn, *args, **kwargs).result()
+
+
+async def run_read(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking read on the reader pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, functools.partial(fn, *args, **kwargs))
+
+
+async def run_write(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Queue a write and wait for it to commit without blocking the event loop."""
+    return await asyncio.wrap_future(submit_write(fn, *args, **kwargs))
+
+
+def close_db() -> None:
+    """
+    Commit any queued writes and stop the writer thread.
+    Later writes fail until init_db is called again.
+    """
+    global _writer, _closed
+
+    with _writer_lock:
+        _closed = True
+        if _writer is not None and _writer.is_alive():
+            _writes.put(None)
+            _writer.join()
+        _writer = None
+        # Threads that read again get a fresh connection
+        for conn in _reader_conns:
+            conn.close()
+        _reader_conns.clear()
@@ -1,109 +1,491 @@
+import json
 import logging
-import os
-from typing import Optional
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
 
 from app.config import get_settings
-from app.database.connection import get_db
+from app.database.connection import read_db, run_read, run_write, submit_write, write
+from app.services import storage
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+_SCAN_STATE_KEY = "output_scan"
+
+# Songs with their analysis features, if any
+_SONGS_WITH_FEATURES = """
+    SELECT s.*, f.bpm, f.key, f.lufs, f.peak_db, f.spectral_centroid, f.sub_bass, f.analyzed_at
+    FROM songs s LEFT JOIN song_features f ON f.song_id = s.id
+"""
+
+# Columns of a library listing page, in the order get_page returns them
+_LISTING_SONG_COLUMNS = (
+    "id", "prompt", "duration", "filename", "processed_filename", "custom_name", "is_favorite",
+    "created_at", "updated_at",
+)
+_LISTING_FEATURE_COLUMNS = ("bpm", "key", "lufs", "peak_db", "spectral_centroid", "sub_bass", "analyzed_at")
+LISTING_COLUMNS = _LISTING_SONG_COLUMNS + _LISTING_FEATURE_COLUMNS
+_LISTING_SELECT = f"""
+    SELECT {", ".join([f"s.{c}" for c in _LISTING_SONG_COLUMNS] + [f"f.{c}" for c in _LISTING_FEATURE_COLUMNS])}
+    FROM songs s LEFT JOIN song_features f ON f.song_id = s.id
+"""
+
+# /songs filter name -> SQL condition on the features
+_FEATURE_FILTERS = {
+    "bpm_min": "f.bpm >= ?",
+    "bpm_max": "f.bpm <= ?",
+    "key": "f.key = ?",
+    "lufs_min": "f.lufs >= ?",
+    "lufs_max": "f.lufs <= ?",
+    "peak_max": "f.peak_db <= ?",
+    "centroid_min": "f.spectral_centroid >= ?",
+    "centroid_max": "f.spectral_centroid <= ?",
+    "sub_bass_min": "f.sub_bass >= ?",
+    "sub_bass_max": "f.sub_bass <= ?",
+}
+
+_FEATURE_COLUMNS = (
+    "song_id", "filename", "bpm", "key", "lufs", "peak_db", "spectral_centroid", "sub_bass", "embedding",
+)
+
+
+_IMPORT_COLUMNS = (
+    "prompt", "duration", "filename", "processed_filename", "custom_name",
+    "is_favorite", "created_at", "updated_at", "content_hash",
+)
+
+
+def _feature_conditions(filters: Optional[dict]) -> tuple[str, list]:
+    """Build a WHERE clause from /songs feature filters, ignoring unset ones."""
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    if not filters:
+        return "", []
+    conditions = [_FEATURE_FILTERS[name] for name in filters]
+    return f"WHERE {' AND '.join(conditions)}", list(filters.values())
+
+
+class Query:
+    """
+    A repository method written against a connection.
+
+    Calling it blocks (for threads and scripts); `run_async` awaits it from
+    the event loop. Reads run on a per-thread read-only connection, writes
+    are queued for the writer thread and group-committed with other writes.
+    """
+
+    def __init__(self, fn: Callable, writes: bool):
+        self.fn = fn
+        self.writes = writes
+        self.__doc__ = fn.__doc__
+        self.__name__ = fn.__name__
+
+    def __call__(self, *args, **kwargs):
+        if self.writes:
+            return write(self.fn, *args, **kwargs)
+        with read_db() as conn:
+            return self.fn(conn, *args, **kwargs)
+
+    async def run_async(self, *args, **kwargs):
+        if self.writes:
+            return await run_write(self.fn, *args, **kwargs)
+        return await run_read(self, *args, **kwargs)
+
+    def submit(self, *args, **kwargs) -> Future:
+        """Queue a write without waiting for it to commit."""
+        return submit_write(self.fn, *args, **kwargs)
+
+    def on(self, conn, *args, **kwargs):
+        """Run inside another query, on its connection and transaction."""
+        return self.fn(conn, *args, **kwargs)
+
+
+def reads(fn: Callable) -> Query:
+    return Query(fn, writes=False)
+
+
+def writes(fn: Callable) -> Query:
+    return Query(fn, writes=True)
+
 
 class SongRepository:
-    """Repository for song CRUD operations."""
+    """
+    Repository for song CRUD operations.
+    Request handlers await `SongRepository.<method>.run_async(...)`.
+    """
 
-    @staticmethod
-    def create(prompt: str, duration: int, filename: str) -> dict:
+    @writes
+    def create(conn, prompt: str, duration: int, filename: str) -> dict:
         """Create a new song record."""
-        with get_db() as conn:
+        cursor = conn.execute(
+            "INSERT INTO songs (prompt, duration, filename) VALUES (?, ?, ?)",
+            (prompt, duration, filename)
+        )
+        return SongRepository.get_by_id.on(conn, cursor.lastrowid)
+
+    @writes
+    def create_many(conn, songs: list[tuple[str, int, str]]) -> list[dict]:
+        """Create several song records from (prompt, duration, filename) tuples in one transaction."""
+        conn.executemany(
+            "INSERT INTO songs (prompt, duration, filename) VALUES (?, ?, ?)",
+            songs
+        )
+        filenames = [filename for _, _, filename in songs]
+        placeholders = ",".join("?" * len(filenames))
+        rows = conn.execute(
+            f"SELECT * FROM songs WHERE filename IN ({placeholders}) ORDER BY id",
+            filenames
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @writes
+    def import_songs(conn, songs: list[dict]) -> list[int]:
+        """
+        Insert songs from an archive in one transaction, keeping their metadata.
+
+        Args:
+            songs: Dicts with the _IMPORT_COLUMNS fields
+
+        Returns:
+            IDs of the new songs, in the same order
+        """
+        placeholders = ", ".join("?" * len(_IMPORT_COLUMNS))
+        ids = []
+        for song in songs:
             cursor = conn.execute(
-                "INSERT INTO songs (prompt, duration, filename) VALUES (?, ?, ?)",
-                (prompt, duration, filename)
+                f"INSERT INTO songs ({', '.join(_IMPORT_COLUMNS)}) VALUES ({placeholders})",
+                tuple(song[column] for column in _IMPORT_COLUMNS)
             )
-            return SongRepository.get_by_id(cursor.lastrowid)
+            ids.append(cursor.lastrowid)
+        return ids
 
-    @staticmethod
-    def get_all(limit: int = 100, offset: int = 0) -> list[dict]:
-        """Get all songs, ordered by newest first."""
-        with get_db() as conn:
-            rows = conn.execute(
-                "SELECT * FROM songs ORDER BY created_at DESC LIMIT ? OFFSET ?",
-                (limit, offset)
+    @reads
+    def get_all(conn, limit: int = 100, offset: int = 0, filters: Optional[dict] = None) -> list[dict]:
+        """
+        Get songs with their features, ordered by newest first.
+
+        Args:
+            filters: Feature ranges keyed like the /songs query parameters
+                (bpm_min, lufs_max, ...); songs not yet analyzed never match
+        """
+        where, params = _feature_conditions(filters)
+        rows = conn.execute(
+            f"{_SONGS_WITH_FEATURES} {where} ORDER BY s.created_at DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @reads
+    def get_page(conn, limit: int = 100, offset: int = 0, filters: Optional[dict] = None) -> tuple[int, list[tuple]]:
+        """
+        Get a page of the library listing and the total it's taken from.
+        Both are read in one transaction, so the total matches the page.
+        Rows are plain tuples in LISTING_COLUMNS order, for building responses without per-row dicts.
+
+        Args:
+            filters: Feature ranges, as for get_all
+        """
+        where, params = _feature_conditions(filters)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        conn.execute("BEGIN")
+        try:
+            rows = cursor.execute(
+                f"{_LISTING_SELECT} {where} ORDER BY s.created_at DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
             ).fetchall()
-            return [dict(row) for row in rows]
+            total = SongRepository.count.on(conn, filters)
+        finally:
+            conn.execute("COMMIT")
+        return total, rows
 
-    @staticmethod
-    def get_by_id(song_id: int) -> Optional[dict]:
-        """Get a song by ID."""
-        with get_db() as conn:
-            row = conn.execute(
-                "SELECT * FROM songs WHERE id = ?", (song_id,)
-            ).fetchone()
-            return dict(row) if row else None
+    @reads
+    def get_by_id(conn, song_id: int) -> Optional[dict]:
+        """Get a song by ID, with its features."""
+        row = conn.execute(
+            f"{_SONGS_WITH_FEATURES} WHERE s.id = ?", (song_id,)
+        ).fetchone()
+        return dict(row) if row else None
 
-    @staticmethod
-    def get_by_filename(filename: str) -> Optional[dict]:
+    @reads
+    def get_many(conn, song_ids: list[int]) -> list[dict]:
+        """Get songs by ID, with their features, in the order given."""
+        if not song_ids:
+            return []
+        placeholders = ",".join("?" * len(song_ids))
+        rows = conn.execute(
+            f"{_SONGS_WITH_FEATURES} WHERE s.id IN ({placeholders})", song_ids
+        ).fetchall()
+        by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[song_id] for song_id in song_ids if song_id in by_id]
+
+    @reads
+    def get_by_filename(conn, filename: str) -> Optional[dict]:
         """Get a song by filename."""
-        with get_db() as conn:
-            row = conn.execute(
-                "SELECT * FROM songs WHERE filename = ?", (filename,)
-            ).fetchone()
-            return dict(row) if row else None
+        row = conn.execute(
+            "SELECT * FROM songs WHERE filename = ?", (filename,)
+        ).fetchone()
+        return dict(row) if row else None
 
-    @staticmethod
-    def update(song_id: int, **kwargs) -> Optional[dict]:
+    @writes
+    def update(conn, song_id: int, **kwargs) -> Optional[dict]:
         """Update a song's metadata."""
         valid_fields = {"custom_name", "is_favorite", "processed_filename"}
         updates = {k: v for k, v in kwargs.items() if k in valid_fields and v is not None}
 
         if not updates:
-            return SongRepository.get_by_id(song_id)
+            return SongRepository.get_by_id.on(conn, song_id)
 
         set_clause = ", ".join(f"{k} = ?" for k in updates)
         values = list(updates.values()) + [song_id]
 
-        with get_db() as conn:
-            conn.execute(
-                f"UPDATE songs SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                values
-            )
-            return SongRepository.get_by_id(song_id)
+        conn.execute(
+            f"UPDATE songs SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            values
+        )
+        return SongRepository.get_by_id.on(conn, song_id)
 
-    @staticmethod
-    def delete(song_id: int) -> bool:
+    @writes
+    def delete(conn, song_id: int) -> bool:
         """Delete a song by ID."""
-        with get_db() as conn:
-            cursor = conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
-            return cursor.rowcount > 0
+        cursor = conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
+        return cursor.rowcount > 0
 
-    @staticmethod
-    def count() -> int:
-        """Get total count of songs."""
-        with get_db() as conn:
+    @writes
+    def delete_many(conn, song_ids: list[int]) -> int:
+        """Delete several songs in one transaction."""
+        cursor = conn.executemany(
+            "DELETE FROM songs WHERE id = ?", [(song_id,) for song_id in song_ids]
+        )
+        return cursor.rowcount
+
+    @writes
+    def touch(conn, filename: str) -> None:
+        """Record that a song was accessed, at most once per hour."""
+        conn.execute(
+            """UPDATE songs SET last_accessed_at = CURRENT_TIMESTAMP
+            WHERE filename = ? AND (
+                last_accessed_at IS NULL
+                OR last_accessed_at < datetime('now', '-1 hour')
+            )""",
+            (filename,)
+        )
+
+    @reads
+    def get_coldest(conn, before: Optional[str] = None, include_favorites: bool = False) -> list[dict]:
+        """
+        Get songs ordered by least recent access (or creation if never accessed).
+
+        Args:
+            before: Only return songs last accessed before this SQLite timestamp
+            include_favorites: Whether favorite songs are included
+        """
+        conditions = []
+        params = []
+        if not include_favorites:
+            conditions.append("is_favorite = 0")
+        if before:
+            conditions.append("COALESCE(last_accessed_at, created_at) < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = conn.execute(
+            f"""SELECT id, filename, processed_filename, is_favorite,
+                COALESCE(last_accessed_at, created_at) AS last_access
+            FROM songs {where} ORDER BY last_access ASC""",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @reads
+    def count(conn, filters: Optional[dict] = None) -> int:
+        """Get total count of songs, optionally matching feature filters."""
+        where, params = _feature_conditions(filters)
+        if not where:
             row = conn.execute("SELECT COUNT(*) as count FROM songs").fetchone()
-            return row["count"]
+        else:
+            row = conn.execute(
+                f"SELECT COUNT(*) as count FROM song_features f {where}", params
+            ).fetchone()
+        return row["count"]
+
+    @reads
+    def get_content_hashes(conn) -> dict[str, int]:
+        """Get the song ID for each known raw file content hash."""
+        rows = conn.execute(
+            "SELECT id, content_hash FROM songs WHERE content_hash IS NOT NULL"
+        ).fetchall()
+        return {row["content_hash"]: row["id"] for row in rows}
+
+    @reads
+    def get_unhashed(conn) -> list[dict]:
+        """Get songs whose content hash hasn't been computed yet."""
+        rows = conn.execute(
+            "SELECT id, filename FROM songs WHERE content_hash IS NULL"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @writes
+    def save_content_hashes(conn, hashes: dict[int, str]) -> None:
+        """Store content hashes by song ID in one transaction."""
+        conn.executemany(
+            "UPDATE songs SET content_hash = ? WHERE id = ?",
+            [(content_hash, song_id) for song_id, content_hash in hashes.items()]
+        )
+
+    @reads
+    def get_unanalyzed(conn, reanalyze: bool = False) -> list[dict]:
+        """
+        Get songs whose features are missing, lack a similarity embedding or
+        were measured on another file (e.g. before the song was processed).
+
+        Args:
+            reanalyze: Return every song instead
+        """
+        stale = "" if reanalyze else (
+            "WHERE f.song_id IS NULL OR f.embedding IS NULL "
+            "OR f.filename != COALESCE(s.processed_filename, s.filename)"
+        )
+        rows = conn.execute(
+            f"""SELECT s.id, s.filename, s.processed_filename
+            FROM songs s LEFT JOIN song_features f ON f.song_id = s.id
+            {stale} ORDER BY s.id"""
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @reads
+    def get_embeddings(conn, since: Optional[str] = None) -> dict[int, bytes]:
+        """
+        Get stored similarity embeddings by song ID.
+
+        Args:
+            since: Only return embeddings analyzed at or after this SQLite timestamp
+        """
+        condition = "AND analyzed_at >= ?" if since else ""
+        rows = conn.execute(
+            f"SELECT song_id, embedding FROM song_features WHERE embedding IS NOT NULL {condition}",
+            (since,) if since else ()
+        ).fetchall()
+        return {row["song_id"]: row["embedding"] for row in rows}
+
+    @writes
+    def save_features(conn, features: list[dict]) -> None:
+        """
+        Store analysis results, replacing any earlier ones, in one transaction.
+        Results for songs deleted while they were being analyzed are dropped.
+        """
+        placeholders = ", ".join("?" * len(_FEATURE_COLUMNS))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO song_features ({', '.join(_FEATURE_COLUMNS)}) "
+            f"SELECT {placeholders} WHERE EXISTS (SELECT 1 FROM songs WHERE id = ?)",
+            [
+                tuple(row[column] for column in _FEATURE_COLUMNS) + (row["song_id"],)
+                for row in features
+            ]
+        )
 
     @staticmethod
-    def validate_and_cleanup() -> dict:
-        """Validate songs have existing files, remove orphaned records."""
-        with get_db() as conn:
+    def validate_and_cleanup(force: bool = False) -> dict:
+        """
+        Reconcile song records with the audio files in OUTPUT_DIR.
+
+        The directory scan is compared as a set against the database:
+        records whose raw file is gone are removed, missing processed files
+        are cleared from their record, and files no record owns are reported
+        (and deleted when CLEANUP_ORPHAN_FILES is set). The mtime of each
+        shard directory is remembered, so only shards that changed since the
+        last run, or that hold songs added or updated since, are rescanned.
+
+        Args:
+            force: Rescan every shard
+        """
+        started = time.time()
+
+        # Rows and mtimes are read before the scan: a song's file is always
+        # written before its record, so every row read here has its file on
+        # disk, and anything written during the scan shows up next run
+        directories = storage.directory_fingerprint()
+        with read_db() as conn:
             songs = conn.execute(
-                "SELECT id, filename, processed_filename FROM songs"
+                "SELECT id, filename, processed_filename, updated_at FROM songs"
             ).fetchall()
+            row = conn.execute(
+                "SELECT value FROM library_state WHERE key = ?", (_SCAN_STATE_KEY,)
+            ).fetchone()
 
-            orphaned = []
-            for song in songs:
-                file_path = os.path.join(settings.OUTPUT_DIR, song["filename"])
-                if not os.path.exists(file_path):
-                    orphaned.append(song["id"])
-                    logger.warning(f"Orphaned song record: {song['filename']}")
+        state = {
+            "max_id": max((song["id"] for song in songs), default=0),
+            "updated_at": max((song["updated_at"] for song in songs), default=""),
+            "directories": directories,
+        }
+        previous = json.loads(row["value"]) if row and not force else {}
 
+        if "max_id" in previous:
+            known = previous["directories"]
+            shards = {name for name in directories.keys() | known.keys() if directories.get(name) != known.get(name)}
+            shards.update(
+                storage.shard_name(song["filename"]) for song in songs
+                if song["id"] > previous["max_id"] or song["updated_at"] > previous["updated_at"]
+            )
+            if not shards:
+                return {"validated": 0, "removed": 0, "cleared": 0, "orphan_files": 0, "skipped": True}
+            files = storage.scan_output_files(shards)
+            # Files left at the top level belong to songs in shards that may not have changed
+            unscanned = {storage.shard_name(name) for name in files} - shards
+            if unscanned:
+                files.update(storage.scan_output_files(unscanned))
+                shards |= unscanned
+            songs = [song for song in songs if storage.shard_name(song["filename"]) in shards]
+        else:
+            files = storage.scan_output_files()
+
+        orphaned = []
+        cleared = []
+        owned = set()
+        for song in songs:
+            if song["filename"] not in files:
+                orphaned.append((song["id"],))
+                logger.warning(f"Orphaned song record: {song['filename']}")
+                continue
+            owned.add(song["filename"])
+            if song["processed_filename"] and song["processed_filename"] not in files:
+                cleared.append((song["id"],))
+                logger.warning(f"Missing processed file: {song['processed_filename']}")
+
+        # Files written after the scan started belong to in-flight requests
+        orphan_files = [
+            name for name, entry in files.items()
+            if storage.source_filename(name) not in owned
+            and entry.stat().st_mtime < started
+        ]
+        for name in orphan_files:
+            if settings.CLEANUP_ORPHAN_FILES:
+                storage.remove(name)
+                logger.info(f"Removed orphaned file: {name}")
+            else:
+                logger.warning(f"Orphaned file: {name}")
+
+        def reconcile(conn) -> None:
             if orphaned:
-                placeholders = ",".join("?" * len(orphaned))
-                conn.execute(
-                    f"DELETE FROM songs WHERE id IN ({placeholders})",
-                    orphaned
-                )
+                conn.executemany("DELETE FROM songs WHERE id = ?", orphaned)
                 logger.info(f"Cleaned up {len(orphaned)} orphaned records")
+            if cleared:
+                conn.executemany(
+                    "UPDATE songs SET processed_filename = NULL, "
+                    "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    cleared
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO library_state (key, value) VALUES (?, ?)",
+                (_SCAN_STATE_KEY, json.dumps(state)),
+            )
+
+        write(reconcile)
 
-            return {"validated": len(songs), "removed": len(orphaned)}
+        return {
+            "validated": len(songs),
+            "removed": len(orphaned),
+            "cleared": len(cleared),
+            "orphan_files": len(orphan_files),
+            "skipped": False,
+        }
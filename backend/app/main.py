@@ -1,6 +1,5 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from app.config import get_settings
 from app.core.lifespan import lifespan
@@ -24,8 +23,5 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount output directory for audio file serving
-app.mount("/output", StaticFiles(directory=settings.OUTPUT_DIR), name="output")
-
-# Include API routes
+# Include API routes (audio files are served by the output route)
 app.include_router(router)
@@ -1,12 +1,49 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# Scheduling class of a generation: interactive jobs run first, and long
+# bulk and background jobs pause for them between segments
+Priority = Literal["interactive", "bulk", "background"]
 
 
 class GenerateRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=500)
+    # Tracks longer than one model window are generated window by window
+    duration: int = Field(default=15, ge=1, le=settings.MAX_DURATION)
+    priority: Priority = "interactive"
+    # Optional library song used as a melody reference or continuation seed
+    reference_song_id: Optional[int] = None
+    reference_mode: Literal["melody", "continuation"] = "melody"
+
+
+class GenerateBatchRequest(BaseModel):
+    prompts: Optional[list[str]] = Field(default=None, min_length=1, max_length=32)
+    prompt: Optional[str] = Field(default=None, min_length=1, max_length=500)
+    num_variations: int = Field(default=1, ge=1, le=16)
+    # Seeds the whole batch; clips are sampled together, so there is no
+    # per-clip seed. Resubmitting the same request with the same seed
+    # reproduces every clip while MAX_BATCH_SIZE is unchanged.
+    seed: Optional[int] = None
     duration: int = Field(default=15, ge=1, le=60)
+    priority: Priority = "bulk"
+
+    @model_validator(mode="after")
+    def check_prompts(self) -> "GenerateBatchRequest":
+        if (self.prompts is None) == (self.prompt is None):
+            raise ValueError("Provide either prompts or prompt")
+        if any(not p or len(p) > 500 for p in self.prompts or []):
+            raise ValueError("Each prompt must be 1-500 characters")
+        total = len(self.prompts or [self.prompt]) * self.num_variations
+        if total > 64:
+            raise ValueError("A batch can generate at most 64 clips")
+        return self
 
 
 class ProcessRequest(BaseModel):
@@ -19,10 +56,70 @@ class AudioResponse(BaseModel):
     url: str
 
 
+class StorageStats(BaseModel):
+    usage_bytes: int
+    budget_bytes: int
+    files: int
+    compressed_files: int
+    evicted_songs: int
+    last_run: Optional[float] = None
+
+
 class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
     device: str
+    storage: Optional[StorageStats] = None
+
+
+class JobSong(BaseModel):
+    id: int
+    filename: str
+    url: str
+    prompt: str
+
+
+class JobPartial(BaseModel):
+    # The part of a long track written so far, playable while the rest generates
+    filename: str
+    url: str
+    seconds: float
+    window: int
+    windows: int
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    priority: str
+    status: str
+    position: Optional[int] = None
+    progress: float = 0.0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    partial: Optional[JobPartial] = None
+    songs: list[JobSong] = []
+    # Seed a finished batch was generated with, to resubmit it reproducibly
+    seed: Optional[int] = None
+
+
+class QueueWaitStats(BaseModel):
+    # Waits (submission to start) in seconds, over recently started jobs
+    queued: int
+    samples: int
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+    # Wait objective and the share of sampled jobs that met it
+    objective: Optional[float] = None
+    met: Optional[float] = None
+
+
+class QueueStats(BaseModel):
+    classes: dict[str, QueueWaitStats]
 
 
 class ErrorResponse(BaseModel):
@@ -35,6 +132,16 @@ class SongUpdate(BaseModel):
     is_favorite: Optional[bool] = None
 
 
+class SongFeatures(BaseModel):
+    bpm: Optional[float] = None
+    key: Optional[str] = None
+    lufs: Optional[float] = None
+    peak_db: Optional[float] = None
+    spectral_centroid: Optional[float] = None
+    sub_bass: Optional[float] = None
+    analyzed_at: datetime
+
+
 class SongResponse(BaseModel):
     id: int
     prompt: str
@@ -47,6 +154,7 @@ class SongResponse(BaseModel):
     updated_at: datetime
     url: str
     processed_url: Optional[str] = None
+    features: Optional[SongFeatures] = None
 
     class Config:
         from_attributes = True
@@ -57,6 +165,21 @@ class SongListResponse(BaseModel):
     total: int
 
 
+class ImportResponse(BaseModel):
+    imported: int
+    duplicates: int  # Songs skipped because their audio is already in the library
+    files: int
+
+
+class SimilarSong(SongResponse):
+    similarity: float  # Cosine similarity to the query song, up to 1
+
+
+class SimilarSongsResponse(BaseModel):
+    song_id: int
+    songs: list[SimilarSong]
+
+
 # Hugging Face processing schemas
 class HFProcessRequest(BaseModel):
     filename: str = Field(..., min_length=1)
@@ -1,34 +1,94 @@
-import os
+import random
 import uuid
+from concurrent.futures import Future, wait
+from typing import Callable, Optional
 
 from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from app.config import get_settings
 from app.database.repository import SongRepository
-from app.models.schemas import GenerateRequest, AudioResponse
-from app.services import musicgen
+from app.models.schemas import GenerateRequest, GenerateBatchRequest, AudioResponse, JobResponse
+from app.routes.jobs import job_to_response
+from app.services import analysis, jobs, musicgen, output, storage
 
 router = APIRouter()
 settings = get_settings()
 
 
-@router.post("/generate", response_model=AudioResponse)
-async def generate_music(req: GenerateRequest, request: Request) -> AudioResponse:
+async def _resolve_reference(req: GenerateRequest) -> Optional[str]:
+    """Get the audio path of the request's reference song, if any."""
+    if req.reference_song_id is None:
+        return None
+
+    reference = await SongRepository.get_by_id.run_async(req.reference_song_id)
+    reference_path = reference and await run_in_threadpool(storage.resolve, reference["filename"])
+    if not reference_path:
+        raise HTTPException(status_code=404, detail="Reference song not found")
+    SongRepository.touch.submit(reference["filename"])
+    return reference_path
+
+
+def _generation(req: GenerateRequest, reference_path: Optional[str]) -> Callable[[jobs.Job], Future]:
+    """Build the job that generates, writes and records a single song."""
+    filename = f"gen_{uuid.uuid4()}.wav"
+
+    def run(job: jobs.Job) -> "Future | dict":
+        # Melody conditioning can't be chained, so long melody requests fail on its length check
+        if musicgen.is_long_form(req.duration) and not (reference_path and req.reference_mode == "melody"):
+            return _run_long_form(job, req, reference_path, filename)
+
+        wav = musicgen.generate_audio(
+            req.prompt, req.duration, reference_path, req.reference_mode, progress=job.on_progress
+        )
+
+        def record() -> dict:
+            song = SongRepository.create(prompt=req.prompt, duration=req.duration, filename=filename)
+            analysis.schedule([song["id"]])
+            return {"songs": [{"id": song["id"], "filename": filename, "prompt": req.prompt}]}
+
+        return output.write_batch(
+            wav, musicgen.get_sample_rate(), [storage.file_path(filename)], then=record
+        )
+
+    return run
+
+
+def _run_long_form(job: jobs.Job, req: GenerateRequest, reference_path: Optional[str], filename: str) -> dict:
+    """
+    Generate a long track window by window, appending each window to its file
+    as soon as it's decoded. Every written window is published on the job, so
+    clients can start playing the track before it's finished, and waiting
+    higher-priority jobs run between windows.
+    """
+    path = storage.file_path(filename)
+    writer = output.TrackWriter(path, musicgen.get_sample_rate(), settings.LONG_FORM_CROSSFADE)
     try:
-        filename = f"gen_{uuid.uuid4()}"
-        output_path = os.path.join(settings.OUTPUT_DIR, filename)
+        windows = musicgen.generate_windows(req.prompt, req.duration, reference_path, progress=job.on_progress)
+        for index, count, wav, overlap in windows:
+            writer.add(wav, overlap)
+            job.set_partial(filename, writer.seconds, index + 1, count)
+            job.checkpoint()
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
 
-        musicgen.generate_audio(req.prompt, req.duration, output_path)
+    song = SongRepository.create(prompt=req.prompt, duration=req.duration, filename=filename)
+    analysis.schedule([song["id"]])
+    return {"songs": [{"id": song["id"], "filename": filename, "prompt": req.prompt}]}
 
-        final_filename = f"{filename}.wav"
-        url = str(request.url_for("output", path=final_filename))
 
-        # Create song record in database
-        SongRepository.create(
-            prompt=req.prompt,
-            duration=req.duration,
-            filename=final_filename,
+@router.post("/generate", response_model=AudioResponse)
+async def generate_music(req: GenerateRequest, request: Request) -> AudioResponse:
+    try:
+        job = jobs.submit(
+            "generate", _generation(req, await _resolve_reference(req)), req.priority, req.duration
         )
+        result = await job.wait()
+
+        final_filename = result["songs"][0]["filename"]
+        url = str(request.url_for("output", path=final_filename))
 
         return AudioResponse(
             status="success",
@@ -36,6 +96,92 @@ async def generate_music(req: GenerateRequest, request: Request) -> AudioRespons
             url=url,
         )
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/generate/jobs", response_model=JobResponse, status_code=202)
+async def submit_generation(req: GenerateRequest, request: Request) -> JobResponse:
+    """
+    Queue a generation without holding the request open.
+    Follow it on /ws/jobs or /jobs/{id}/events.
+    """
+    job = jobs.submit("generate", _generation(req, await _resolve_reference(req)), req.priority, req.duration)
+    return job_to_response(job, request)
+
+
+def _run_batch(job: jobs.Job, prompts: list[str], seed: int, duration: int) -> Future:
+    """
+    Generate a batch in chunks of MAX_BATCH_SIZE and record every song at once.
+    Each chunk is written in the background while the next one generates, and
+    waiting higher-priority jobs run between chunks. Chunk i is seeded with
+    seed + i, so jobs run in between don't change the batch's output.
+    """
+    filenames = [f"gen_{uuid.uuid4()}.wav" for _ in prompts]
+    chunks = range(0, len(prompts), settings.MAX_BATCH_SIZE)
+    writes = []
+
+    def discard() -> None:
+        # Songs are only recorded once the whole batch is written, so files
+        # from a failed batch would be left as orphans
+        wait(writes)
+        for filename in filenames:
+            storage.remove(filename)
+
+    try:
+        for index, start in enumerate(chunks):
+            chunk = slice(start, start + settings.MAX_BATCH_SIZE)
+            wav = musicgen.generate(
+                prompts[chunk], duration, seed=seed + index,
+                progress=lambda done, total, index=index: job.set_progress((index + done / total) / len(chunks)),
+            )
+            paths = [storage.file_path(filename) for filename in filenames[chunk]]
+            writes.append(output.write_batch(wav, musicgen.get_sample_rate(), paths))
+            job.checkpoint()
+    except Exception:
+        discard()
+        raise
+
+    def record() -> dict:
+        songs = SongRepository.create_many(
+            [(prompt, duration, filename) for prompt, filename in zip(prompts, filenames)]
+        )
+        analysis.schedule([song["id"] for song in songs])
+        return {
+            "songs": [
+                {"id": song["id"], "filename": song["filename"], "prompt": song["prompt"]}
+                for song in songs
+            ],
+            "seed": seed,
+        }
+
+    written = output.when_all(writes, then=record)
+    written.add_done_callback(lambda done: done.exception() and discard())
+    return written
+
+
+@router.post("/generate/batch", response_model=JobResponse, status_code=202)
+async def generate_batch(req: GenerateBatchRequest, request: Request) -> JobResponse:
+    """
+    Generate many clips in batched model calls.
+    Returns a job handle; poll /jobs/{id} for the resulting songs.
+    """
+    prompts = [
+        prompt
+        for prompt in (req.prompts or [req.prompt])
+        for _ in range(req.num_variations)
+    ]
+    seed = req.seed if req.seed is not None else random.randrange(2**31)
+
+    # The batch costs one clip's duration per model call
+    calls = -(-len(prompts) // settings.MAX_BATCH_SIZE)
+    job = jobs.submit(
+        "generate_batch", lambda job: _run_batch(job, prompts, seed, req.duration),
+        req.priority, req.duration * calls,
+    )
+    return job_to_response(job, request)
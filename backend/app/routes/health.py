@@ -1,7 +1,7 @@
 from fastapi import APIRouter
 
-from app.models.schemas import HealthResponse
-from app.services import musicgen
+from app.models.schemas import HealthResponse, StorageStats
+from app.services import musicgen, retention
 
 router = APIRouter()
 
@@ -12,4 +12,5 @@ async def health_check() -> HealthResponse:
         status="ok",
         model_loaded=musicgen.is_model_loaded(),
         device=musicgen.get_device(),
+        storage=StorageStats(**retention.get_stats()),
     )
@@ -4,17 +4,19 @@ Provides stem separation and denoising via HF Inference API.
 """
 
 import logging
-import os
 
 from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from app.config import get_settings
+from app.database.repository import SongRepository
 from app.models.schemas import (
     HFProcessRequest,
     HFStemResponse,
     HFDenoiseResponse,
     HFModelStatusResponse,
 )
+from app.services import storage
 from app.services.huggingface import (
     separate_stems,
     denoise_audio,
@@ -46,14 +48,15 @@ async def api_separate_stems(req: HFProcessRequest, request: Request) -> HFStemR
     Separate audio into stems using Demucs.
     Returns vocals, drums, bass, and other stems.
     """
-    input_path = os.path.join(settings.OUTPUT_DIR, req.filename)
+    input_path = await run_in_threadpool(storage.resolve, req.filename)
 
-    if not os.path.exists(input_path):
+    if not input_path:
         raise HTTPException(status_code=404, detail="Audio file not found")
+    SongRepository.touch.submit(storage.source_filename(req.filename))
 
     try:
         logger.info(f"Starting stem separation for: {req.filename}")
-        stem_files = await separate_stems(input_path, settings.OUTPUT_DIR)
+        stem_files = await separate_stems(input_path)
 
         return HFStemResponse(
             status="success",
@@ -74,14 +77,15 @@ async def api_denoise_audio(req: HFProcessRequest, request: Request) -> HFDenois
     Denoise/enhance audio using SpeechBrain model.
     Returns a cleaned version of the audio.
     """
-    input_path = os.path.join(settings.OUTPUT_DIR, req.filename)
+    input_path = await run_in_threadpool(storage.resolve, req.filename)
 
-    if not os.path.exists(input_path):
+    if not input_path:
         raise HTTPException(status_code=404, detail="Audio file not found")
+    SongRepository.touch.submit(storage.source_filename(req.filename))
 
     try:
         logger.info(f"Starting denoising for: {req.filename}")
-        output_filename = await denoise_audio(input_path, settings.OUTPUT_DIR)
+        output_filename = await denoise_audio(input_path)
 
         url = str(request.url_for("output", path=output_filename))
 
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.requests import HTTPConnection
+
+from app.models.schemas import JobPartial, JobResponse, JobSong, QueueStats, QueueWaitStats
+from app.services import jobs
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Seconds between SSE keep-alive comments, well under proxy read timeouts
+KEEPALIVE_INTERVAL = 15
+
+
+def job_to_response(job: jobs.Job, conn: HTTPConnection) -> JobResponse:
+    """Convert a job to its response model, with URLs for finished songs."""
+    result = job.result or {}
+    return JobResponse(
+        id=job.id,
+        kind=job.kind,
+        priority=job.priority,
+        status=job.status,
+        position=jobs.position(job),
+        progress=job.progress,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        partial=job.partial and JobPartial(
+            **job.partial, url=str(conn.url_for("output", path=job.partial["filename"]))
+        ),
+        songs=[
+            JobSong(**song, url=str(conn.url_for("output", path=song["filename"])))
+            for song in result.get("songs", [])
+        ],
+        seed=result.get("seed"),
+    )
+
+
+def _event(event: str, job: jobs.Job, conn: HTTPConnection) -> dict:
+    return {"event": event, "job": job_to_response(job, conn).model_dump(mode="json")}
+
+
+@router.get("/jobs/stats", response_model=QueueStats)
+async def queue_stats() -> QueueStats:
+    """Queue wait metrics per priority class, to check interactive jobs meet their objective."""
+    return QueueStats(classes={
+        priority: QueueWaitStats(**stats) for priority, stats in jobs.wait_stats().items()
+    })
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, request: Request):
+    """Get the status of a background job."""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_response(job, request)
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Stream a job's state changes as server-sent events until it finishes."""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        subscription = jobs.subscribe({job_id})
+        try:
+            # Current state first, so events published before subscribing aren't missed
+            event, current = job.status, job
+            while True:
+                payload = job_to_response(current, request).model_dump_json()
+                yield f"event: {event}\ndata: {payload}\n\n"
+                if current.status in jobs.TERMINAL_STATUSES:
+                    return
+                while True:
+                    try:
+                        event, current = await asyncio.wait_for(subscription.get(), KEEPALIVE_INTERVAL)
+                        break
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws/jobs")
+async def jobs_socket(websocket: WebSocket):
+    """
+    Multiplexed job feed for one client.
+
+    The client sends {"subscribe": [job IDs]} or {"subscribe": "*"} for every
+    job, and {"unsubscribe": [job IDs]}. Each subscribed job's current state is
+    sent immediately, followed by {"event": ..., "job": ...} messages.
+    """
+    await websocket.accept()
+    subscription = jobs.subscribe(set())
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            subscribe = message.get("subscribe")
+            if subscribe == "*":
+                subscription.job_ids = None
+            elif subscribe:
+                if subscription.job_ids is not None:
+                    subscription.job_ids |= set(subscribe)
+                for job_id in subscribe:
+                    job = jobs.get(job_id)
+                    if job:
+                        await websocket.send_json(_event(job.status, job, websocket))
+                    else:
+                        await websocket.send_json({"event": "unknown", "job_id": job_id})
+            unsubscribe = message.get("unsubscribe")
+            if unsubscribe and subscription.job_ids is not None:
+                subscription.job_ids -= set(unsubscribe)
+
+    async def send():
+        while True:
+            event, job = await subscription.get()
+            await websocket.send_json(_event(event, job, websocket))
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                logger.error(f"Job socket failed: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
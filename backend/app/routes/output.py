@@ -0,0 +1,43 @@
+from typing import Iterator
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.database.repository import SongRepository
+from app.services import output, storage
+
+router = APIRouter()
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _read_prefix(path: str, size: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while size > 0:
+            chunk = f.read(min(CHUNK_SIZE, size))
+            if not chunk:
+                return
+            size -= len(chunk)
+            yield chunk
+
+
+# HEAD is answered as the legacy server's static mount did, for clients that check a file before fetching it
+@router.api_route("/output/{path}", methods=["GET", "HEAD"], name="output")
+def get_output(path: str) -> Response:
+    """Serve an audio file, decompressing it first if it was archived to FLAC."""
+    file_path = storage.resolve(path)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    growing = output.growing_size(file_path)
+    if growing is not None:
+        # A long track still being generated: serve the windows flushed so far, uncached
+        return StreamingResponse(
+            _read_prefix(file_path, growing),
+            media_type="audio/wav",
+            headers={"Content-Length": str(growing), "Cache-Control": "no-store"},
+        )
+
+    # Fire and forget: serving the file doesn't wait for the access time to commit
+    SongRepository.touch.submit(storage.source_filename(path))
+    return FileResponse(file_path, media_type="audio/wav")
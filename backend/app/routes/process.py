@@ -1,11 +1,10 @@
-import os
-
 from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from app.config import get_settings
 from app.database.repository import SongRepository
 from app.models.schemas import ProcessRequest, AudioResponse
-from app.services import effects
+from app.services import analysis, effects, storage
 
 router = APIRouter()
 settings = get_settings()
@@ -14,20 +13,23 @@ settings = get_settings()
 @router.post("/process", response_model=AudioResponse)
 async def process_music(req: ProcessRequest, request: Request) -> AudioResponse:
     try:
-        input_path = os.path.join(settings.OUTPUT_DIR, req.filename)
+        input_path = await run_in_threadpool(storage.resolve, req.filename)
 
-        if not os.path.exists(input_path):
+        if not input_path:
             raise HTTPException(status_code=404, detail="File not found on server")
+        # Resolving may have thawed the file; mark it warm so retention doesn't compress it straight back
+        SongRepository.touch.submit(storage.source_filename(req.filename))
 
         output_filename = f"tickled_{req.filename}"
-        output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
+        output_path = storage.file_path(output_filename)
 
-        effects.apply_effects(input_path, output_path)
+        await run_in_threadpool(effects.apply_effects, input_path, output_path)
 
         # Update song record with processed filename
-        song = SongRepository.get_by_filename(req.filename)
+        song = await SongRepository.get_by_filename.run_async(req.filename)
         if song:
-            SongRepository.update(song["id"], processed_filename=output_filename)
+            await SongRepository.update.run_async(song["id"], processed_filename=output_filename)
+            analysis.schedule([song["id"]])
 
         url = str(request.url_for("output", path=output_filename))
 
@@ -1,14 +1,38 @@
-import os
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+from datetime import datetime
+from typing import Optional
 
+import anyio
 from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library encoder is used without it
+    orjson = None
 
 from app.config import get_settings
 from app.database.repository import SongRepository
-from app.models.schemas import SongResponse, SongListResponse, SongUpdate
+from app.models.schemas import (
+    SongResponse, SongListResponse, SongUpdate, SongFeatures, SimilarSong, SimilarSongsResponse,
+    ImportResponse,
+)
+from app.services import analysis, archive, similarity, storage
 
 router = APIRouter()
 settings = get_settings()
 
+# Fields a listing can be narrowed to with ?fields=
+LISTING_FIELDS = tuple(SongResponse.model_fields)
+_FEATURE_NAMES = tuple(name for name in SongFeatures.model_fields if name != "analyzed_at")
+# Listings smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
 
 def song_to_response(song: dict, request: Request) -> SongResponse:
     """Convert database row to response model with URLs."""
@@ -28,41 +52,225 @@ def song_to_response(song: dict, request: Request) -> SongResponse:
             if song["processed_filename"]
             else None
         ),
+        features=(
+            SongFeatures(**{name: song[name] for name in SongFeatures.model_fields})
+            if song.get("analyzed_at")
+            else None
+        ),
     )
 
 
+def _timestamp(value: str) -> str:
+    """Format a stored timestamp as SongResponse serializes it (ISO 8601, UTC as Z)."""
+    value = value.replace(" ", "T", 1)
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def _listing_row(row: tuple, output_url: str) -> dict:
+    """Build a SongResponse-shaped dict from a SongRepository.get_page row, without validation."""
+    (
+        song_id, prompt, duration, filename, processed_filename, custom_name, is_favorite,
+        created_at, updated_at, *features, analyzed_at,
+    ) = row
+    return {
+        "id": song_id,
+        "prompt": prompt,
+        "duration": duration,
+        "filename": filename,
+        "processed_filename": processed_filename,
+        "custom_name": custom_name,
+        "is_favorite": bool(is_favorite),
+        "created_at": _timestamp(created_at),
+        "updated_at": _timestamp(updated_at),
+        "url": output_url + filename,
+        "processed_url": output_url + processed_filename if processed_filename else None,
+        "features": (
+            {**dict(zip(_FEATURE_NAMES, features)), "analyzed_at": _timestamp(analyzed_at)}
+            if analyzed_at
+            else None
+        ),
+    }
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    """Weak comparison of an ETag against each tag in an If-None-Match header."""
+    opaque = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Check an Accept-Encoding header allows gzip, honouring q-values (q=0 refuses it)."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def _dumps(content: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
 @router.get("/songs", response_model=SongListResponse)
 async def list_songs(
     request: Request,
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    bpm_min: Optional[float] = Query(None, ge=0),
+    bpm_max: Optional[float] = Query(None, ge=0),
+    key: Optional[str] = Query(None, description='e.g. "F# minor"'),
+    lufs_min: Optional[float] = None,
+    lufs_max: Optional[float] = None,
+    peak_max: Optional[float] = Query(None, description="Peak level in dBFS"),
+    centroid_min: Optional[float] = Query(None, ge=0, description="Spectral centroid in Hz"),
+    centroid_max: Optional[float] = Query(None, ge=0),
+    sub_bass_min: Optional[float] = Query(None, ge=0, le=1, description="Share of power below 60 Hz"),
+    sub_bass_max: Optional[float] = Query(None, ge=0, le=1),
+    fields: Optional[str] = Query(None, description="Comma-separated song fields to return, e.g. id,url,custom_name"),
+):
+    """
+    List songs, ordered by newest first.
+    Feature filters only match songs that have been analyzed.
+
+    Pages carry an ETag and are gzipped for clients that accept it; a
+    request whose If-None-Match matches gets an empty 304.
+    """
+    projection = None
+    if fields:
+        projection = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = set(projection) - set(LISTING_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    filters = {
+        "bpm_min": bpm_min,
+        "bpm_max": bpm_max,
+        "key": key,
+        "lufs_min": lufs_min,
+        "lufs_max": lufs_max,
+        "peak_max": peak_max,
+        "centroid_min": centroid_min,
+        "centroid_max": centroid_max,
+        "sub_bass_min": sub_bass_min,
+        "sub_bass_max": sub_bass_max,
+    }
+    total, rows = await SongRepository.get_page.run_async(limit, offset, filters)
+
+    # Resolve the output route once; every song URL shares its prefix
+    output_url = str(request.url_for("output", path="_"))[:-1]
+    songs = [_listing_row(row, output_url) for row in rows]
+    if projection:
+        songs = [{name: song[name] for name in projection} for song in songs]
+    body = _dumps({"songs": songs, "total": total})
+
+    # Weak, as the same tag covers the gzipped and plain encodings
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= GZIP_MIN_SIZE and _accepts_gzip(request.headers.get("accept-encoding", "")):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@router.get("/songs/export")
+def export_songs(
+    ids: Optional[list[int]] = Query(None, description="Songs to export (default: all)"),
+    favorites: bool = False,
 ):
-    """List all songs, ordered by newest first."""
-    songs = SongRepository.get_all(limit, offset)
-    total = SongRepository.count()
-    return SongListResponse(
-        songs=[song_to_response(s, request) for s in songs],
-        total=total,
+    """Stream the library (or selected songs) as a tar archive with a manifest and database snapshot."""
+    filename = f"resonator-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tar"
+    return StreamingResponse(
+        archive.export_stream(ids, favorites_only=favorites),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+@router.post("/songs/import", response_model=ImportResponse)
+async def import_songs(request: Request):
+    """
+    Import an archive from /songs/export, sent as the raw request body.
+    Songs already in the library are skipped.
+    """
+    chunks = request.stream()
+
+    def read_chunks():
+        # Pull the body from the event loop as the import thread consumes it
+        while True:
+            try:
+                yield anyio.from_thread.run(chunks.__anext__)
+            except StopAsyncIteration:
+                return
+
+    reader = io.BufferedReader(archive.ChunkReader(read_chunks()), archive.CHUNK_SIZE)
+    try:
+        result = await run_in_threadpool(archive.import_stream, reader)
+    except (ValueError, KeyError, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+
+    analysis.schedule(result["song_ids"])
+    return ImportResponse(**result)
+
+
 @router.get("/songs/{song_id}", response_model=SongResponse)
 async def get_song(song_id: int, request: Request):
     """Get a single song by ID."""
-    song = SongRepository.get_by_id(song_id)
+    song = await SongRepository.get_by_id.run_async(song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
     return song_to_response(song, request)
 
 
+@router.get("/songs/{song_id}/similar", response_model=SimilarSongsResponse)
+def similar_songs(song_id: int, request: Request, k: int = Query(10, ge=1, le=100)):
+    """Find the songs that sound most like a song, most similar first."""
+    song = SongRepository.get_by_id(song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+
+    # Fetch a few extra in case a neighbour was deleted since it was indexed
+    neighbours = similarity.search([song_id], k + 5)[0]
+    if neighbours is None:
+        raise HTTPException(status_code=409, detail="Song has not been analyzed yet")
+
+    # Neighbours deleted since they were indexed are skipped here; a full sync drops them from the index
+    scores = dict(neighbours)
+    songs = SongRepository.get_many([neighbour for neighbour, _ in neighbours])
+
+    return SimilarSongsResponse(
+        song_id=song_id,
+        songs=[
+            SimilarSong(**song_to_response(s, request).model_dump(), similarity=scores[s["id"]])
+            for s in songs[:k]
+        ],
+    )
+
+
 @router.patch("/songs/{song_id}", response_model=SongResponse)
 async def update_song(song_id: int, update: SongUpdate, request: Request):
     """Update a song's metadata (name, favorite status)."""
-    existing = SongRepository.get_by_id(song_id)
+    existing = await SongRepository.get_by_id.run_async(song_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Song not found")
 
-    song = SongRepository.update(
+    song = await SongRepository.update.run_async(
         song_id,
         custom_name=update.custom_name,
         is_favorite=update.is_favorite,
@@ -73,16 +281,16 @@ async def update_song(song_id: int, update: SongUpdate, request: Request):
 @router.delete("/songs/{song_id}")
 async def delete_song(song_id: int):
     """Delete a song and its audio files from disk."""
-    song = SongRepository.get_by_id(song_id)
+    song = await SongRepository.get_by_id.run_async(song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
 
     # Delete audio files from disk
     for filename in [song["filename"], song["processed_filename"]]:
         if filename:
-            filepath = os.path.join(settings.OUTPUT_DIR, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            storage.remove(filename)
 
-    SongRepository.delete(song_id)
+    await SongRepository.delete.run_async(song_id)
+    # Waits on the index lock, which a full sync holds for a whole rebuild
+    await run_in_threadpool(similarity.remove, [song_id])
     return {"status": "deleted", "id": song_id}
@@ -0,0 +1,287 @@
+"""
+Offline audio analysis.
+Measures tempo, key, loudness and spectral balance of library songs with
+vectorized NumPy/SciPy and stores them in the song_features index, which
+backs the range filters on /songs. The same pass computes the embedding
+used for similarity search.
+"""
+
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+from scipy.signal import correlate, get_window
+
+from app.database.repository import SongRepository
+from app.services import similarity, storage
+from app.services.output import integrated_loudness
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stopping = threading.Event()
+
+# STFT frames, and how many are transformed at once to bound memory on long songs
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+FRAMES_PER_BLOCK = 512
+
+TEMPO_RANGE = (60.0, 200.0)
+# Center of the log-normal tempo prior; bass music sits around 140-175 BPM,
+# so half-time readings of drum and bass are penalized
+TEMPO_PRIOR_BPM = 140.0
+
+# The similarity embedding is the mean and deviation of each log-mel band over time
+MEL_BANDS = similarity.EMBEDDING_DIM // 2
+MEL_RANGE = (20.0, 16000.0)
+
+SUB_BASS_RANGE = (20.0, 60.0)
+# Pitch classes are read above the bass, where STFT bins are narrower than a semitone
+CHROMA_RANGE = (200.0, 5000.0)
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+# Krumhansl-Kessler key profiles, starting on the tonic
+_MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+_MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+_KEY_PROFILES = np.stack(
+    [np.roll(_MAJOR_PROFILE, tonic) for tonic in range(12)]
+    + [np.roll(_MINOR_PROFILE, tonic) for tonic in range(12)]
+)
+_KEY_NAMES = [f"{note} major" for note in NOTE_NAMES] + [f"{note} minor" for note in NOTE_NAMES]
+
+
+def _mel_filterbank(sample_rate: int) -> np.ndarray:
+    """Triangular mel filters of shape [MEL_BANDS, F] for the STFT bins."""
+    def to_mel(hz):
+        return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+    def to_hz(mel):
+        return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    freqs = fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate)
+    top = min(MEL_RANGE[1], sample_rate / 2)
+    edges = to_hz(np.linspace(to_mel(MEL_RANGE[0]), to_mel(top), MEL_BANDS + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def _spectrum(mono: np.ndarray, sample_rate: int) -> dict:
+    """
+    Run a short-time Fourier transform block by block.
+
+    Returns:
+        Dict with the long-term power spectrum [F], the spectral flux onset
+        envelope [N] and the mean and deviation of each log-mel band [MEL_BANDS]
+    """
+    if len(mono) < FRAME_SIZE:
+        mono = np.pad(mono, (0, FRAME_SIZE - len(mono)))
+    frames = sliding_window_view(mono, FRAME_SIZE)[::HOP_SIZE]
+    window = get_window("hann", FRAME_SIZE).astype(np.float32)
+    filterbank = _mel_filterbank(sample_rate)
+
+    power_sum = np.zeros(FRAME_SIZE // 2 + 1)
+    mel_sum = np.zeros(MEL_BANDS)
+    mel_square_sum = np.zeros(MEL_BANDS)
+    onsets = []
+    previous = None
+    for start in range(0, len(frames), FRAMES_PER_BLOCK):
+        power = np.abs(fft.rfft(frames[start:start + FRAMES_PER_BLOCK] * window, axis=-1)) ** 2
+        power_sum += power.sum(axis=0)
+
+        log_mel = np.log10(power @ filterbank.T + 1e-10)
+        mel_sum += log_mel.sum(axis=0)
+        mel_square_sum += np.square(log_mel, dtype=np.float64).sum(axis=0)
+
+        # Half-wave rectified flux of the log-compressed magnitude
+        compressed = np.log1p(1000.0 * np.sqrt(power))
+        if previous is not None:
+            compressed = np.concatenate([previous, compressed])
+        onsets.append(np.maximum(np.diff(compressed, axis=0), 0.0).sum(axis=-1))
+        previous = compressed[-1:]
+
+    mel_mean = mel_sum / len(frames)
+    return {
+        "power": power_sum,
+        "onsets": np.concatenate(onsets),
+        "mel_mean": mel_mean,
+        "mel_std": np.sqrt(np.maximum(mel_square_sum / len(frames) - mel_mean ** 2, 0.0)),
+    }
+
+
+def _tempo(onsets: np.ndarray, frame_rate: float) -> Optional[float]:
+    """Estimate the tempo in BPM from the autocorrelation of the onset envelope."""
+    min_lag = int(60.0 * frame_rate / TEMPO_RANGE[1])
+    max_lag = int(math.ceil(60.0 * frame_rate / TEMPO_RANGE[0]))
+    if len(onsets) < 2 * max_lag:
+        return None
+
+    # Smoothing widens the autocorrelation peaks, so tempos whose period falls
+    # between two frames aren't beaten by their better aligned half-tempo
+    onsets = np.convolve(onsets, get_window("hann", 7), mode="same")
+    onsets = onsets - onsets.mean()
+    autocorrelation = correlate(onsets, onsets, mode="full", method="fft")[len(onsets) - 1:]
+    if autocorrelation[0] <= 0:
+        return None
+
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(60.0 * frame_rate / lags / TEMPO_PRIOR_BPM) ** 2)
+    best = int(lags[np.argmax(autocorrelation[lags] * prior)])
+
+    # Parabolic interpolation between neighbouring lags for sub-frame precision
+    left, center, right = autocorrelation[best - 1:best + 2]
+    curvature = left - 2 * center + right
+    offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+    return float(60.0 * frame_rate / (best + offset))
+
+
+def _key(power: np.ndarray, freqs: np.ndarray) -> Optional[str]:
+    """Estimate the key by correlating a pitch class profile with the Krumhansl-Kessler profiles."""
+    band = (freqs >= CHROMA_RANGE[0]) & (freqs <= CHROMA_RANGE[1])
+    pitch = 12 * np.log2(freqs[band] / 440.0) + 69
+    chroma = np.bincount(np.round(pitch).astype(int) % 12, weights=np.sqrt(power[band]), minlength=12)
+    if not chroma.any():
+        return None
+
+    scores = np.corrcoef(chroma, _KEY_PROFILES)[0, 1:]
+    return _KEY_NAMES[int(np.argmax(scores))]
+
+
+def _embedding(mel_mean: np.ndarray, mel_std: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Build a unit-length similarity embedding from log-mel statistics.
+    The band means are centered, so the spectral shape is compared rather than
+    the overall level.
+    """
+    vector = np.concatenate([mel_mean - mel_mean.mean(), mel_std]).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 1e-6 else None
+
+
+def _finite(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def analyze_file(path: str) -> dict:
+    """
+    Measure the features of an audio file (WAV or FLAC).
+
+    Returns:
+        Dict with bpm, key, lufs, peak_db (dBFS), spectral_centroid (Hz),
+        sub_bass (share of power between 20 and 60 Hz) and the similarity
+        embedding; values that can't be measured, e.g. on silence, are None
+    """
+    audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    mono = audio.mean(axis=1)
+
+    spectrum = _spectrum(mono, sample_rate)
+    power = spectrum["power"]
+    freqs = fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate)
+    total = power.sum()
+    sub_bass = (freqs >= SUB_BASS_RANGE[0]) & (freqs < SUB_BASS_RANGE[1])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "bpm": _tempo(spectrum["onsets"], sample_rate / HOP_SIZE),
+            "key": _key(power, freqs),
+            "lufs": _finite(integrated_loudness(audio.T[None], sample_rate)[0]),
+            "peak_db": _finite(20 * np.log10(np.abs(audio).max(initial=0.0))),
+            "spectral_centroid": _finite((freqs * power).sum() / total),
+            "sub_bass": _finite(power[sub_bass].sum() / total),
+            "embedding": _embedding(spectrum["mel_mean"], spectrum["mel_std"]),
+        }
+
+
+def analyze_song(song: dict) -> Optional[dict]:
+    """
+    Analyze the version of a song that is played back: the processed file
+    if there is one, otherwise the raw generation.
+
+    Returns:
+        Row for SongRepository.save_features, with the embedding as float32
+        bytes, or None if the file is missing
+    """
+    filename = song["processed_filename"] or song["filename"]
+    path = storage.locate(filename)
+    if not path:
+        return None
+
+    features = analyze_file(path)
+    embedding = features.pop("embedding")
+    return {
+        "song_id": song["id"],
+        "filename": filename,
+        **features,
+        "embedding": embedding.tobytes() if embedding is not None else None,
+    }
+
+
+def index_embeddings(rows: list[dict]) -> None:
+    """Add analyzed songs to the similarity index."""
+    similarity.add({
+        row["song_id"]: np.frombuffer(row["embedding"], dtype=np.float32)
+        for row in rows
+        if row["embedding"] is not None
+    })
+
+
+def _analyze_songs(song_ids: list[int]) -> None:
+    rows = []
+    for song_id in song_ids:
+        if _stopping.is_set():
+            # Shutting down; the rest are picked up as unanalyzed later
+            break
+        song = SongRepository.get_by_id(song_id)
+        if not song:
+            continue
+        try:
+            row = analyze_song(song)
+        except Exception as e:
+            logger.error(f"Analysis failed for song {song_id}: {e}")
+            continue
+        if row:
+            rows.append(row)
+    if rows:
+        SongRepository.save_features(rows)
+        index_embeddings(rows)
+
+
+def schedule(song_ids: list[int]) -> None:
+    """Analyze songs in the background, after their files have been written."""
+    global _executor
+
+    with _executor_lock:
+        if _stopping.is_set():
+            logger.warning(f"Analysis of {len(song_ids)} songs skipped during shutdown")
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+        _executor.submit(_analyze_songs, song_ids)
+
+
+def shutdown() -> None:
+    """
+    Drop queued analyses and wait for the running one to save what it has,
+    before the database closes. Songs left unanalyzed are found again by
+    backfill-features. Scheduling resumes after start().
+    """
+    global _executor
+
+    with _executor_lock:
+        _stopping.set()
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def start() -> None:
+    """Accept analyses again after a shutdown."""
+    _stopping.clear()
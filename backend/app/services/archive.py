@@ -0,0 +1,329 @@
+"""
+Library export and import as streamed tar archives.
+
+An export holds a JSON manifest, a snapshot of the database taken with
+SQLite's backup API and the audio files of every selected song (raw file
+first, then its processed, stem and denoised files). Both directions move
+the audio in fixed-size chunks, so neither the archive nor any file is ever
+held in memory.
+"""
+
+import io
+import json
+import logging
+import os
+import sqlite3
+import tarfile
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, Optional
+
+import soundfile as sf
+
+from app.database import backup_db
+from app.database.repository import SongRepository
+from app.services import storage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+DATABASE_NAME = "resonator.db"
+AUDIO_DIR = "audio"
+FORMAT_VERSION = 1
+
+# Song fields carried in the manifest
+_SONG_FIELDS = (
+    "id", "prompt", "duration", "filename", "processed_filename",
+    "custom_name", "is_favorite", "created_at", "updated_at",
+)
+
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+
+def _stream_file(name: str, path: str) -> Iterator[bytes]:
+    """Yield a tar member for a file, sized from the open handle so it can't change underneath."""
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        yield _header(name, stat.st_size, stat.st_mtime)
+        remaining = stat.st_size
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise IOError(f"{path} shrank while it was exported")
+            remaining -= len(chunk)
+            yield chunk
+        yield _padding(stat.st_size)
+
+
+def _stream_bytes(name: str, data: bytes) -> Iterator[bytes]:
+    yield _header(name, len(data), time.time())
+    yield data
+    yield _padding(len(data))
+
+
+def export_stream(song_ids: Optional[list[int]] = None, favorites_only: bool = False) -> Iterator[bytes]:
+    """
+    Stream a tar archive of the library.
+
+    Args:
+        song_ids: Songs to export, or None for every song
+        favorites_only: Only export favorite songs
+
+    Yields:
+        Chunks of the archive
+    """
+    fd, snapshot = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        # The manifest is read from the snapshot, so both describe the same moment
+        backup_db(snapshot)
+        conn = sqlite3.connect(snapshot)
+        conn.row_factory = sqlite3.Row
+        try:
+            songs = [dict(row) for row in conn.execute("SELECT * FROM songs ORDER BY id")]
+        finally:
+            conn.close()
+
+        if song_ids is not None:
+            wanted = set(song_ids)
+            songs = [song for song in songs if song["id"] in wanted]
+        if favorites_only:
+            songs = [song for song in songs if song["is_favorite"]]
+
+        files_by_song = defaultdict(list)
+        for name, entry in sorted(storage.scan_output_files().items()):
+            files_by_song[storage.source_filename(name)].append(entry)
+
+        manifest_songs = []
+        for song in songs:
+            entries = sorted(
+                files_by_song.get(song["filename"], []),
+                key=lambda entry: os.path.splitext(entry.name)[0] != os.path.splitext(song["filename"])[0],
+            )
+            manifest_songs.append({
+                **{field: song[field] for field in _SONG_FIELDS},
+                "files": [entry.name for entry in entries],
+            })
+            song["entries"] = entries
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "songs": manifest_songs,
+        }
+        yield from _stream_bytes(MANIFEST_NAME, json.dumps(manifest, indent=2).encode())
+        yield from _stream_file(DATABASE_NAME, snapshot)
+    finally:
+        os.remove(snapshot)
+
+    for song in songs:
+        for entry in song["entries"]:
+            try:
+                yield from _stream_file(f"{AUDIO_DIR}/{entry.name}", entry.path)
+            except FileNotFoundError:
+                # Deleted (or thawed from FLAC) since the scan; the manifest lists it, the import skips it
+                logger.warning(f"Skipped file removed during export: {entry.name}")
+
+    # End-of-archive marker
+    yield b"\0" * (2 * tarfile.BLOCKSIZE)
+
+
+def _hash_library() -> dict[str, int]:
+    """Get content hashes for the library, computing any that are missing."""
+    missing = {}
+    for song in SongRepository.get_unhashed():
+        path = storage.locate(song["filename"])
+        if path:
+            missing[song["id"]] = storage.content_hash(path)
+    if missing:
+        SongRepository.save_content_hashes(missing)
+        logger.info(f"Hashed {len(missing)} songs for import deduplication")
+    return SongRepository.get_content_hashes()
+
+
+def _is_song_file(name: str, filename: str) -> bool:
+    """Check an archive name is a plain audio file belonging to the song `filename`."""
+    return (
+        isinstance(name, str)
+        and os.path.basename(name) == name
+        and not name.startswith(".")
+        and os.path.splitext(name)[1].lower() in storage.AUDIO_EXTENSIONS
+        and storage.source_filename(name) == filename
+    )
+
+
+def _check_song(song: dict) -> None:
+    """
+    Reject a manifest song whose names could point outside OUTPUT_DIR or at
+    another song's files; these names become paths and database records.
+    """
+    filename = song.get("filename")
+    if not _is_song_file(filename, filename):
+        raise ValueError(f"Invalid song filename: {filename!r}")
+    processed = song.get("processed_filename")
+    if processed is not None and not _is_song_file(processed, filename):
+        raise ValueError(f"Invalid processed filename for {filename}: {processed!r}")
+    for name in song.get("files", []):
+        if not _is_song_file(name, filename):
+            raise ValueError(f"Invalid file for {filename}: {name!r}")
+
+
+def _copy(source: BinaryIO, path: str) -> None:
+    with open(path, "wb") as f:
+        while chunk := source.read(CHUNK_SIZE):
+            f.write(chunk)
+
+
+def import_stream(fileobj: BinaryIO) -> dict:
+    """
+    Ingest an archive made by export_stream, read front to back.
+
+    Songs whose raw audio matches a song already in the library (by content
+    hash) are skipped along with their other files. Files are staged next to
+    their final location, then moved into place and recorded in one
+    transaction once the whole archive has been read.
+
+    Returns:
+        Counts of imported and duplicate songs, and of files written
+    """
+    known = _hash_library()
+
+    manifest: Optional[dict] = None
+    songs_by_file: dict[str, dict] = {}
+    renames: dict[str, str] = {}  # Archive song filename -> filename in this library
+    staged: list[tuple[str, str]] = []  # (staging path, final path)
+    imported: list[dict] = []
+    duplicates = 0
+
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|") as archive:
+            for member in archive:
+                if member.name == MANIFEST_NAME:
+                    manifest = json.load(archive.extractfile(member))
+                    if manifest.get("version") != FORMAT_VERSION:
+                        raise ValueError(f"Unsupported archive version: {manifest.get('version')}")
+                    # Checked before anything is staged; audio members are
+                    # only written under names listed (and checked) here
+                    for song in manifest["songs"]:
+                        _check_song(song)
+                    for song in manifest["songs"]:
+                        for name in song["files"]:
+                            songs_by_file[name] = song
+                    continue
+
+                directory, _, name = member.name.partition("/")
+                if directory != AUDIO_DIR or not member.isfile():
+                    continue
+                if manifest is None:
+                    raise ValueError("Archive must start with its manifest")
+                song = songs_by_file.get(name)
+                if song is None or song.get("skip") or not _is_song_file(name, song["filename"]):
+                    continue
+
+                source_base = os.path.splitext(song["filename"])[0]
+                is_raw = os.path.splitext(name)[0] == source_base
+                if not is_raw and "imported" not in song:
+                    # Derived file without its raw file; the song can't be imported
+                    continue
+
+                target_base = os.path.splitext(renames.get(song["filename"], song["filename"]))[0]
+                final = storage.file_path(name.replace(source_base, target_base, 1))
+                staging = f"{final}.part"
+                _copy(archive.extractfile(member), staging)
+                staged.append((staging, final))
+
+                if not is_raw:
+                    continue
+
+                try:
+                    content_hash = storage.content_hash(staging)
+                except sf.SoundFileError as e:
+                    raise ValueError(f"Unreadable audio file {name}: {e}") from e
+                if content_hash in known:
+                    os.remove(staging)
+                    staged.pop()
+                    song["skip"] = True
+                    duplicates += 1
+                    continue
+
+                if storage.locate(f"{target_base}.wav"):
+                    # Same name, different audio: give the song a fresh name
+                    target_base = f"gen_{uuid.uuid4()}"
+                    renames[song["filename"]] = f"{target_base}.wav"
+                    moved = storage.file_path(name.replace(source_base, target_base, 1))
+                    os.replace(staging, f"{moved}.part")
+                    staged[-1] = (f"{moved}.part", moved)
+
+                known[content_hash] = 0
+                song["imported"] = content_hash
+                imported.append(song)
+
+        records = []
+        for song in imported:
+            filename = renames.get(song["filename"], song["filename"])
+            processed = song["processed_filename"]
+            if processed:
+                base = os.path.splitext(song["filename"])[0]
+                processed = processed.replace(base, os.path.splitext(filename)[0], 1)
+            if not _is_song_file(filename, filename) or (processed and not _is_song_file(processed, filename)):
+                raise ValueError(f"Invalid song filename: {song['filename']!r}")
+            records.append({
+                **{field: song[field] for field in _SONG_FIELDS if field != "id"},
+                "filename": filename,
+                "processed_filename": processed,
+                "content_hash": song["imported"],
+            })
+
+        # Files go into place before their records, as everywhere else
+        for staging, final in staged:
+            os.replace(staging, final)
+        staged = [(final, final) for _, final in staged]
+        song_ids = SongRepository.import_songs(records)
+    except Exception:
+        for path, _ in staged:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    return {
+        "imported": len(song_ids),
+        "duplicates": duplicates,
+        "files": len(staged),
+        "song_ids": song_ids,
+    }
+
+
+class ChunkReader(io.RawIOBase):
+    """Blocking file-like view of an iterator of byte chunks, for tarfile."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
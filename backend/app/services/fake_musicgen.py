@@ -0,0 +1,146 @@
+"""
+Synthetic stand-in for MusicGen.
+Selected with MODEL_BACKEND=fake, it exposes the parts of the MusicGen
+interface the generation service uses and renders deterministic bass lines
+on the CPU, sleeping FAKE_STEP_MS per decode step to stand in for the
+language model. This allows the service to be run, load-tested and
+benchmarked without a GPU or a model checkpoint.
+"""
+
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import soundfile as sf
+import torch
+
+SAMPLE_RATE = 32000
+FRAME_RATE = 50
+NUM_CODEBOOKS = 4
+CARDINALITY = 2048
+MAX_DURATION = 30.0
+
+# Token meaning per codebook: bass note, amplitude, hi-hat noise level, stereo detune
+_PITCH, _AMPLITUDE, _NOISE, _DETUNE = range(NUM_CODEBOOKS)
+# Natural minor scale, in semitones above the root
+_SCALE = torch.tensor([0, 2, 3, 5, 7, 8, 10])
+_ROOT_MIDI = 28  # E1
+
+
+def read_audio(path: str, sample_rate: int, channels: int) -> torch.Tensor:
+    """Load an audio file as [C, T] at the given rate and channel count, as audiocraft's audio_read and convert_audio do."""
+    data, sr = sf.read(path, dtype="float32", always_2d=True)
+    wav = torch.from_numpy(data.T)
+    if wav.shape[0] != channels:
+        wav = wav.mean(dim=0, keepdim=True).expand(channels, -1)
+    if sr != sample_rate:
+        length = int(wav.shape[-1] * sample_rate / sr)
+        wav = torch.nn.functional.interpolate(wav[None], size=length, mode="linear", align_corners=False)[0]
+    return wav
+
+
+class FakeCompressionModel:
+    """Maps between audio and fake tokens, like EnCodec does for real ones."""
+
+    def __init__(self, channels: int):
+        self.channels = channels
+        self.hop = SAMPLE_RATE // FRAME_RATE
+
+    def encode(self, wav: torch.Tensor) -> tuple[torch.Tensor, None]:
+        """Derive tokens of shape [B, K, T] from the loudness of each frame of [B, C, T] audio."""
+        frames = wav.shape[-1] // self.hop
+        rms = wav[..., :frames * self.hop].reshape(*wav.shape[:2], frames, self.hop).pow(2).mean(dim=(1, 3)).sqrt()
+        level = (rms.clamp(0, 1) * (CARDINALITY - 1)).long()
+        codes = torch.stack([level % 24, level, level // 4, level % 7], dim=1)
+        return codes, None
+
+    def decode(self, codes: torch.Tensor, scale: None = None) -> torch.Tensor:
+        """Render tokens of shape [B, K, T] to audio of shape [B, C, T * hop]."""
+        params = codes.float().repeat_interleave(self.hop, dim=-1)
+        midi = _ROOT_MIDI + params[:, _PITCH]
+        frequency = 440.0 * 2.0 ** ((midi - 69.0) / 12.0)
+        amplitude = params[:, _AMPLITUDE] / (CARDINALITY - 1)
+        noise_level = 0.3 * params[:, _NOISE] / (CARDINALITY - 1)
+        detune = 1.0 + 0.004 * params[:, _DETUNE] / (CARDINALITY - 1)
+
+        generator = torch.Generator().manual_seed(int(codes.sum()))
+        channels = []
+        for channel in range(self.channels):
+            step = frequency * (detune if channel else 1.0) / SAMPLE_RATE
+            phase = 2.0 * torch.pi * torch.cumsum(step, dim=-1)
+            bass = torch.tanh(2.0 * torch.sin(phase)) * amplitude
+            noise = torch.randn(bass.shape, generator=generator) * noise_level
+            channels.append(0.5 * (bass + noise))
+        return torch.stack(channels, dim=1)
+
+
+class FakeMusicGen:
+    """Deterministic MusicGen replacement: the same prompt and seed always give the same audio."""
+
+    def __init__(self, name: str, step_time: float):
+        self.name = name
+        self.step_time = step_time
+        self.sample_rate = SAMPLE_RATE
+        self.frame_rate = FRAME_RATE
+        self.audio_channels = 2 if "stereo" in name else 1
+        self.max_duration = MAX_DURATION
+        self.device = "cpu"
+        self.duration = 15.0
+        self.compression_model = FakeCompressionModel(self.audio_channels)
+        # No text or melody conditioners, so melody generation is reported as unsupported
+        self.lm = SimpleNamespace(condition_provider=SimpleNamespace(conditioners={}))
+        self._progress_callback: Optional[Callable[[int, int], None]] = None
+
+    def set_generation_params(self, duration: float = 30.0, **kwargs) -> None:
+        self.duration = duration
+
+    def set_custom_progress_callback(self, progress_callback: Optional[Callable[[int, int], None]] = None) -> None:
+        self._progress_callback = progress_callback
+
+    def _prepare_tokens_and_attributes(self, descriptions, prompt, melody_wavs=None):
+        return [SimpleNamespace(text={"description": description}, wav={}) for description in descriptions], None
+
+    def _row_tokens(self, description: str, start: int, length: int) -> torch.Tensor:
+        """Tokens [K, length] for frames `start` onwards of a beat-synced bass line."""
+        key = zlib.crc32(description.encode())
+        # The global RNG makes seeded generations reproducible and variations of a prompt differ
+        generator = torch.Generator().manual_seed(key ^ int(torch.randint(0, 2**31, (1,))))
+        bpm = 140 + key % 36
+        beat = (torch.arange(start, start + length) * bpm / (60.0 * FRAME_RATE))
+        position = beat - beat.floor()
+
+        notes = _SCALE[torch.randint(0, len(_SCALE), (int(beat[-1]) + 1,), generator=generator)]
+        pitch = notes[beat.long()]
+        amplitude = (CARDINALITY - 1) * (0.3 + 0.7 * torch.exp(-3.0 * position))
+        noise = torch.where((position >= 0.5) & (position < 0.6), CARDINALITY - 1, 0)
+        detune = torch.full((length,), key % CARDINALITY)
+        return torch.stack([pitch, amplitude.long(), noise, detune])
+
+    def _generate_tokens(self, attributes, prompt_tokens: Optional[torch.Tensor], progress: bool = False) -> torch.Tensor:
+        total = int(self.duration * self.frame_rate)
+        start = 0 if prompt_tokens is None else prompt_tokens.shape[-1]
+        steps = total - start
+
+        # Step by step, as the language model decodes
+        began = time.perf_counter()
+        for step in range(1, steps + 1):
+            delay = began + step * self.step_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if progress and self._progress_callback is not None:
+                self._progress_callback(step, steps)
+
+        rows = [self._row_tokens(attr.text["description"] or "", start, steps) for attr in attributes]
+        tokens = torch.stack(rows)
+        if prompt_tokens is not None:
+            tokens = torch.cat([prompt_tokens.to(tokens.dtype), tokens], dim=-1)
+        return tokens
+
+    def generate_audio(self, gen_tokens: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.compression_model.decode(gen_tokens, None)
+
+    def generate(self, descriptions: list[str], progress: bool = False) -> torch.Tensor:
+        attributes, _ = self._prepare_tokens_and_attributes(descriptions, None)
+        return self.generate_audio(self._generate_tokens(attributes, None, progress))
@@ -0,0 +1,79 @@
+"""
+Conditioning feature cache.
+Stores features extracted from reference audio (melody chroma, EnCodec tokens)
+on disk and in memory, keyed by the content hash of the source file.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import torch
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Features depend on the model; the fake backend's tokens are kept apart from the real model's
+_MODEL_KEY = settings.MODEL_NAME if settings.MODEL_BACKEND == "musicgen" else settings.MODEL_BACKEND
+CACHE_DIR = os.path.join(settings.OUTPUT_DIR, ".features", _MODEL_KEY.replace("/", "--"))
+
+_hashes: dict[str, tuple[int, int, str]] = {}
+_memory: OrderedDict[str, torch.Tensor] = OrderedDict()
+_lock = threading.Lock()
+
+
+def file_hash(path: str) -> str:
+    """Get the SHA-256 of a file, re-hashing only when its size or mtime change."""
+    stat = os.stat(path)
+    known = _hashes.get(path)
+    if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+        return known[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    _hashes[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def get_or_compute(path: str, kind: str, compute: Callable[[], torch.Tensor]) -> torch.Tensor:
+    """
+    Get a cached feature for an audio file, computing it on a miss.
+
+    Args:
+        path: Path to the source audio file
+        kind: Feature name, e.g. "chroma" or "codes"
+        compute: Extracts the feature from the file, called only on a miss
+
+    Returns:
+        The feature tensor, on the CPU
+    """
+    key = f"{file_hash(path)}.{kind}"
+
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+
+    cache_path = os.path.join(CACHE_DIR, f"{key}.pt")
+    if os.path.exists(cache_path):
+        feature = torch.load(cache_path)
+    else:
+        logger.info(f"Extracting {kind} features from {os.path.basename(path)}")
+        feature = compute().detach().cpu()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{cache_path}.tmp"
+        torch.save(feature, tmp)
+        os.replace(tmp, cache_path)
+
+    with _lock:
+        _memory[key] = feature
+        while len(_memory) > settings.FEATURE_CACHE_SIZE:
+            _memory.popitem(last=False)
+    return feature
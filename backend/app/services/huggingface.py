@@ -13,6 +13,7 @@ import httpx
 import soundfile as sf
 
 from app.config import get_settings
+from app.services import storage
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -69,13 +70,12 @@ async def check_model_status(model_id: str) -> dict:
             return {"status": "error", "model": model_id, "message": str(e)}
 
 
-async def separate_stems(audio_path: str, output_dir: str) -> dict[str, str]:
+async def separate_stems(audio_path: str) -> dict[str, str]:
     """
     Separate audio into stems using Demucs model.
 
     Args:
         audio_path: Path to input audio file
-        output_dir: Directory to save output stems
 
     Returns:
         Dictionary mapping stem names to output filenames
@@ -125,7 +125,7 @@ async def separate_stems(audio_path: str, output_dir: str) -> dict[str, str]:
 
             # Save stem file
             stem_filename = f"{base_name}_stem_{stem_name}.wav"
-            stem_path = os.path.join(output_dir, stem_filename)
+            stem_path = storage.file_path(stem_filename)
 
             with open(stem_path, "wb") as f:
                 f.write(audio_bytes)
@@ -136,13 +136,12 @@ async def separate_stems(audio_path: str, output_dir: str) -> dict[str, str]:
         return stem_files
 
 
-async def denoise_audio(audio_path: str, output_dir: str) -> str:
+async def denoise_audio(audio_path: str) -> str:
     """
     Denoise/enhance audio using SpeechBrain SepFormer model.
 
     Args:
         audio_path: Path to input audio file
-        output_dir: Directory to save output
 
     Returns:
         Filename of the denoised audio
@@ -182,7 +181,7 @@ async def denoise_audio(audio_path: str, output_dir: str) -> str:
         # Generate output filename
         base_name = os.path.splitext(os.path.basename(audio_path))[0]
         output_filename = f"{base_name}_denoised.wav"
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = storage.file_path(output_filename)
 
         # Save denoised audio
         with open(output_path, "wb") as f:
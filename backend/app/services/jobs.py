@@ -0,0 +1,360 @@
+"""
+Background job queue for model work.
+Jobs run one at a time on a dedicated worker thread, so the model is never
+used from two requests at once and long generations don't block the event loop.
+The queue is ordered by priority class, then shortest job first by requested
+duration; long jobs yield to waiting jobs of a higher class at segment
+boundaries. State changes are published to subscribers for the SSE and
+WebSocket feeds.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import statistics
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+# Priority classes, most urgent first
+PRIORITIES = ("interactive", "bulk", "background")
+# Queue waits kept per class for the wait metrics
+WAIT_SAMPLES = 1000
+
+_sequence = itertools.count()
+
+
+@dataclass
+class Job:
+    kind: str
+    run: Callable[["Job"], "dict | Future"] = field(repr=False)
+    priority: str = "interactive"
+    cost: float = 0.0  # Requested audio seconds, for shortest-job-first ordering
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued, running, paused, writing, completed, failed
+    progress: float = 0.0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    partial: Optional[dict] = None  # Part of a long track written so far
+    future: Future = field(default_factory=Future, repr=False)
+    sequence: int = field(default_factory=lambda: next(_sequence), repr=False)
+
+    def __lt__(self, other: "Job") -> bool:
+        return self.sort_key < other.sort_key
+
+    @property
+    def sort_key(self) -> tuple[int, float, int]:
+        return PRIORITIES.index(self.priority), self.cost, self.sequence
+
+    async def wait(self) -> dict:
+        """Wait for the job to finish and return its result, or raise its error."""
+        return await asyncio.wrap_future(self.future)
+
+    def set_progress(self, fraction: float) -> None:
+        """Record generation progress, publishing at most once per percent."""
+        fraction = min(max(fraction, 0.0), 1.0)
+        if int(fraction * 100) > int(self.progress * 100):
+            self.progress = fraction
+            _publish("progress", self)
+
+    def set_partial(self, filename: str, seconds: float, window: int, windows: int) -> None:
+        """Record that another window of a long track was written, and publish it."""
+        self.partial = {"filename": filename, "seconds": seconds, "window": window, "windows": windows}
+        _publish("window", self)
+
+    def on_progress(self, generated_tokens: int, tokens_to_generate: int) -> None:
+        """MusicGen progress callback."""
+        if tokens_to_generate:
+            self.set_progress(generated_tokens / tokens_to_generate)
+
+    def checkpoint(self) -> None:
+        """
+        Let waiting jobs of a higher priority class run before continuing.
+        Long jobs call this at segment boundaries (between batch chunks or
+        long-form windows), where the model holds none of their state.
+        During shutdown the job is stopped here instead.
+        """
+        if _stopping:
+            raise RuntimeError("Server is shutting down")
+        while True:
+            with _condition:
+                if not _pending or _pending[0].sort_key[0] >= self.sort_key[0]:
+                    return
+                urgent = heapq.heappop(_pending)
+                waiting = list(_pending)
+
+            logger.info(f"Job {self.id} ({self.priority}) paused for job {urgent.id} ({urgent.priority})")
+            self.status = "paused"
+            _publish("paused", self)
+            _run(urgent, waiting)
+            self.status = "running"
+            _publish("running", self)
+
+
+class Subscription:
+    """
+    A feed of job events for one client connection.
+
+    Events are (event, job) pairs delivered on the subscriber's event loop.
+    A subscription follows either a set of job IDs or every job.
+    """
+
+    def __init__(self, job_ids: Optional[set[str]] = None):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[tuple[str, Job]] = asyncio.Queue()
+        self.job_ids = job_ids
+
+    def wants(self, job: Job) -> bool:
+        return self.job_ids is None or job.id in self.job_ids
+
+    async def get(self) -> tuple[str, Job]:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        with _condition:
+            if self in _subscriptions:
+                _subscriptions.remove(self)
+
+
+_jobs: dict[str, Job] = {}
+_pending: list[Job] = []  # Heap ordered by Job.sort_key
+_waits: dict[str, deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+_subscriptions: list[Subscription] = []
+_condition = threading.Condition()
+_worker: Optional[threading.Thread] = None
+_stopping = False
+
+
+def submit(
+    kind: str,
+    run: Callable[[Job], "dict | Future"],
+    priority: str = "interactive",
+    cost: float = 0.0,
+) -> Job:
+    """
+    Queue a job for the worker thread.
+
+    Args:
+        kind: Job type, reported back to clients
+        run: Called with the job on the worker thread. Returns the job result,
+            or a Future for work that finishes off the worker (e.g. file writes),
+            in which case the worker moves on to the next job immediately.
+        priority: One of PRIORITIES
+        cost: Requested audio seconds; shorter jobs of a class run first
+    """
+    global _worker
+
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+
+    job = Job(kind=kind, run=run, priority=priority, cost=cost)
+    with _condition:
+        if _stopping:
+            raise RuntimeError("Server is shutting down")
+        _prune()
+        _jobs[job.id] = job
+        heapq.heappush(_pending, job)
+        # Jobs the new one was queued ahead of moved back a place
+        overtaken = [pending for pending in _pending if job < pending]
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="job-worker", daemon=True)
+            _worker.start()
+        _condition.notify()
+    _publish("queued", job)
+    for pending in overtaken:
+        _publish("queued", pending)
+    return job
+
+
+def start() -> None:
+    """Accept jobs again after a shutdown."""
+    global _stopping
+
+    with _condition:
+        _stopping = False
+
+
+def shutdown(timeout: Optional[float] = None) -> None:
+    """
+    Stop the worker before the database closes.
+
+    Queued jobs fail straight away, the running job stops at its next
+    checkpoint, and the file writes of finished jobs are waited for, so
+    every song written is also recorded. New jobs are refused until start().
+
+    Args:
+        timeout: Seconds to wait for the running job and for writes
+    """
+    global _stopping
+
+    with _condition:
+        _stopping = True
+        queued = list(_pending)
+        _pending.clear()
+        worker = _worker
+        _condition.notify_all()
+    for job in queued:
+        _finish(job, error=RuntimeError("Server is shutting down"))
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if worker is not None:
+        worker.join(timeout)
+        if worker.is_alive():
+            logger.warning("Job worker still busy at shutdown")
+    remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+    _, unfinished = wait([job.future for job in list(_jobs.values())], remaining)
+    if unfinished:
+        logger.warning(f"{len(unfinished)} jobs unfinished at shutdown")
+
+
+def get(job_id: str) -> Optional[Job]:
+    """Get a job by ID."""
+    return _jobs.get(job_id)
+
+
+def position(job: Job) -> Optional[int]:
+    """Get the number of jobs queued ahead of a job, or None if it isn't queued."""
+    with _condition:
+        if job.status != "queued":
+            return None
+        return sum(1 for pending in _pending if pending < job)
+
+
+def wait_stats() -> dict[str, dict]:
+    """
+    Summarize queue waits (submission to start) of recently started jobs per priority class.
+
+    Returns:
+        For each class: jobs queued now, waits sampled, p50/p95/p99/max wait
+        in seconds and, where the class has a wait objective, its target and
+        the share of sampled jobs that met it
+    """
+    objectives = {"interactive": settings.INTERACTIVE_WAIT_SLO}
+    with _condition:
+        queued = {priority: 0 for priority in PRIORITIES}
+        for pending in _pending:
+            queued[pending.priority] += 1
+        samples = {priority: list(waits) for priority, waits in _waits.items()}
+
+    stats = {}
+    for priority in PRIORITIES:
+        waits = samples[priority]
+        entry = {"queued": queued[priority], "samples": len(waits)}
+        if waits:
+            cuts = statistics.quantiles(waits * 2 if len(waits) == 1 else waits, n=100, method="inclusive")
+            entry.update(p50=cuts[49], p95=cuts[94], p99=cuts[98], max=max(waits))
+        if objectives.get(priority):
+            entry["objective"] = objectives[priority]
+            entry["met"] = sum(wait <= objectives[priority] for wait in waits) / len(waits) if waits else None
+        stats[priority] = entry
+    return stats
+
+
+def subscribe(job_ids: Optional[set[str]] = None) -> Subscription:
+    """
+    Subscribe to job events from the current event loop.
+
+    Args:
+        job_ids: Jobs to follow (the set may be changed later), or None for all jobs
+    """
+    subscription = Subscription(job_ids)
+    with _condition:
+        _subscriptions.append(subscription)
+    return subscription
+
+
+def _publish(event: str, job: Job) -> None:
+    """Deliver an event to every interested subscriber, from any thread."""
+    with _condition:
+        targets = [s for s in _subscriptions if s.wants(job)]
+    for subscription in targets:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, (event, job))
+        except RuntimeError:
+            # The subscriber's event loop has shut down
+            subscription.close()
+
+
+def _prune() -> None:
+    """Forget finished jobs older than JOB_TTL seconds."""
+    cutoff = time.time() - settings.JOB_TTL
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job.finished_at is not None and job.finished_at < cutoff
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def _work() -> None:
+    while True:
+        with _condition:
+            while not _pending and not _stopping:
+                _condition.wait()
+            if _stopping:
+                return
+            job = heapq.heappop(_pending)
+            waiting = list(_pending)
+        _run(job, waiting)
+
+
+def _run(job: Job, waiting: list[Job]) -> None:
+    """Run a job taken off the queue; `waiting` are the jobs still queued."""
+    job.status = "running"
+    job.started_at = time.time()
+    with _condition:
+        _waits[job.priority].append(job.started_at - job.created_at)
+    _publish("running", job)
+    # Everyone still waiting moved up one place
+    for queued in waiting:
+        _publish("queued", queued)
+
+    try:
+        result = job.run(job)
+    except Exception as e:
+        _finish(job, error=e)
+        return
+
+    if isinstance(result, Future):
+        job.status = "writing"
+        _publish("writing", job)
+        result.add_done_callback(lambda done, job=job: _finish_from(job, done))
+    else:
+        _finish(job, result=result)
+
+
+def _finish_from(job: Job, done: Future) -> None:
+    error = done.exception()
+    if error:
+        _finish(job, error=error)
+    else:
+        _finish(job, result=done.result())
+
+
+def _finish(job: Job, result: Optional[dict] = None, error: Optional[BaseException] = None) -> None:
+    job.finished_at = time.time()
+    if error:
+        logger.error(f"Job {job.id} ({job.kind}) failed: {error}")
+        job.error = str(error)
+        job.status = "failed"
+        job.future.set_exception(error)
+    else:
+        job.result = result
+        job.progress = 1.0
+        job.status = "completed"
+        job.future.set_result(result)
+    _publish(job.status, job)
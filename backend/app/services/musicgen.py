@@ -1,13 +1,24 @@
+import threading
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+import soundfile as sf
 import torch
-from audiocraft.models import MusicGen
-from audiocraft.data.audio import audio_write
 
 from app.config import get_settings
+from app.services import features, fake_musicgen
+
+# audiocraft is imported where it's used, so the fake backend runs without it installed
+if TYPE_CHECKING:
+    from audiocraft.models import MusicGen
 
 settings = get_settings()
 
-_model: MusicGen | None = None
+_model: "MusicGen | None" = None
 _device: str = "cpu"
+_load_lock = threading.Lock()
+
+# Called with (generated_tokens, tokens_to_generate) while decoding
+ProgressCallback = Callable[[int, int], None]
 
 
 def get_device() -> str:
@@ -18,31 +29,323 @@ def is_model_loaded() -> bool:
     return _model is not None
 
 
-def load_model() -> None:
+def get_sample_rate() -> int:
+    return load_model().sample_rate
+
+
+def load_model() -> "MusicGen":
+    """
+    Get the model, loading it on first use.
+    Every API surface shares this one copy; concurrent callers wait for the
+    first load instead of starting their own.
+    """
     global _model, _device
 
-    _device = "cuda" if torch.cuda.is_available() else "cpu"
-    if _device == "cpu":
-        print("WARNING: No GPU detected. Generation will be slow!")
+    if _model is not None:
+        return _model
+
+    with _load_lock:
+        if _model is None:
+            if settings.MODEL_BACKEND == "fake":
+                print(f"Using fake model ({settings.FAKE_STEP_MS}ms per decode step)")
+                model = fake_musicgen.FakeMusicGen(settings.MODEL_NAME, settings.FAKE_STEP_MS / 1000)
+            elif settings.MODEL_BACKEND == "musicgen":
+                from audiocraft.models import MusicGen
+
+                _device = "cuda" if torch.cuda.is_available() else "cpu"
+                if _device == "cpu":
+                    print("WARNING: No GPU detected. Generation will be slow!")
+
+                print(f"Loading Model: {settings.MODEL_NAME}...")
+                model = MusicGen.get_pretrained(settings.MODEL_NAME, device=_device)
+            else:
+                raise ValueError(f"Unknown MODEL_BACKEND: {settings.MODEL_BACKEND}")
+            _share_text_conditioning(model)
+            _cache_melody_chroma(model)
+            _model = model
+            print("Model Loaded and Ready.")
+    return _model
+
+
+def _share_text_conditioning(model: "MusicGen") -> None:
+    """
+    Encode each unique prompt only once per batch.
+
+    Variations of the same prompt tokenize to identical rows, so the text
+    encoder runs on the unique rows and the embeddings are gathered back
+    out to the full batch.
+    """
+    conditioner = model.lm.condition_provider.conditioners.get("description")
+    if conditioner is None:
+        return
+
+    encode = conditioner.forward
+
+    def forward(inputs: dict[str, torch.Tensor]):
+        key = torch.cat([inputs["input_ids"], inputs["attention_mask"]], dim=1)
+        unique, inverse = torch.unique(key, dim=0, return_inverse=True)
+        if unique.shape[0] == key.shape[0]:
+            return encode(inputs)
+
+        rows = torch.arange(key.shape[0], device=key.device)
+        first = torch.empty(unique.shape[0], dtype=torch.long, device=key.device)
+        first.scatter_(0, inverse, rows)
+        embeds, mask = encode({name: value[first] for name, value in inputs.items()})
+        return embeds[inverse], mask[inverse]
+
+    conditioner.forward = forward
+
+
+def _cache_melody_chroma(model: "MusicGen") -> None:
+    """
+    Serve melody chroma for library references from the feature cache.
+
+    Rows of a melody batch that carry a reference path get their chroma
+    from the cache, so the expensive stem separation and chroma extraction
+    runs once per reference file. Other rows (including the null rows used
+    for classifier-free guidance) are computed as usual.
+    """
+    conditioner = model.lm.condition_provider.conditioners.get("self_wav")
+    if conditioner is None or not getattr(conditioner, "match_len_on_eval", False):
+        return
+
+    embed = conditioner._get_wav_embedding
+
+    def fit_length(chroma: torch.Tensor) -> torch.Tensor:
+        # Same truncate/repeat as the conditioner applies with match_len_on_eval
+        repeats = -(-conditioner.chroma_len // chroma.shape[0])
+        return chroma.repeat(repeats, 1)[:conditioner.chroma_len]
+
+    def get_wav_embedding(x):
+        cached = [i for i, path in enumerate(x.path) if path is not None]
+        if not cached or conditioner.training or conditioner.eval_wavs is not None:
+            return embed(x)
+
+        rows: list[Optional[torch.Tensor]] = [None] * len(x.path)
+        for i in cached:
+            chroma = features.get_or_compute(
+                x.path[i], "chroma", lambda: _extract_chroma(conditioner, x.path[i])
+            )
+            rows[i] = fit_length(chroma).to(x.wav.device)
+
+        rest = [i for i, row in enumerate(rows) if row is None]
+        if rest:
+            index = torch.tensor(rest, device=x.wav.device)
+            subset = x._replace(
+                wav=x.wav[index],
+                length=x.length[index],
+                sample_rate=[x.sample_rate[i] for i in rest],
+                path=[None] * len(rest),
+                seek_time=[None] * len(rest),
+            )
+            for i, row in zip(rest, embed(subset)):
+                rows[i] = row
+
+        return torch.stack(rows)
+
+    conditioner._get_wav_embedding = get_wav_embedding
+
+
+def _read_audio(path: str, channels: int) -> torch.Tensor:
+    """Load an audio file as [C, T] at the model's sample rate, on its device."""
+    if settings.MODEL_BACKEND == "fake":
+        return fake_musicgen.read_audio(path, _model.sample_rate, channels)
+
+    from audiocraft.data.audio import audio_read
+    from audiocraft.data.audio_utils import convert_audio
+
+    wav, sr = audio_read(path)
+    return convert_audio(wav, sr, _model.sample_rate, channels).to(_model.device)
+
+
+def _extract_chroma(conditioner, path: str) -> torch.Tensor:
+    """Compute the full-length melody chroma of an audio file."""
+    wav = _read_audio(path, 1)
+    return conditioner._compute_wav_embedding(wav[None], _model.sample_rate)[0]
+
+
+def _encode(path: str) -> torch.Tensor:
+    """Encode a whole audio file to EnCodec tokens of shape [K, T]."""
+    wav = _read_audio(path, _model.audio_channels)
+    with torch.no_grad():
+        codes, _ = _model.compression_model.encode(wav[None])
+    return codes[0]
+
 
-    print(f"Loading Model: {settings.MODEL_NAME}...")
-    _model = MusicGen.get_pretrained(settings.MODEL_NAME, device=_device)
-    print("Model Loaded and Ready.")
+def _set_progress(progress: Optional[ProgressCallback]) -> bool:
+    _model.set_custom_progress_callback(progress)
+    return progress is not None
 
 
-def generate_audio(prompt: str, duration: int, output_path: str) -> None:
-    if _model is None:
-        raise RuntimeError("Model not loaded")
+def generate(
+    prompts: list[str],
+    duration: int,
+    seed: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> torch.Tensor:
+    """
+    Generate one clip per prompt in a single batched model call.
+
+    Returns:
+        Audio tensor of shape [B, C, T]
+    """
+    load_model()
+
+    if seed is not None:
+        torch.manual_seed(seed)
 
     _model.set_generation_params(duration=duration)
-    print(f"Generating: {prompt}...")
+    return _model.generate(prompts, progress=_set_progress(progress))
+
+
+def generate_with_melody(
+    prompt: str,
+    duration: int,
+    reference_path: str,
+    progress: Optional[ProgressCallback] = None,
+) -> torch.Tensor:
+    """
+    Generate a clip that follows the melody of a reference file.
+    Requires a melody model (e.g. facebook/musicgen-melody).
+
+    Returns:
+        Audio tensor of shape [1, C, T]
+    """
+    load_model()
+    if "self_wav" not in _model.lm.condition_provider.conditioners:
+        raise ValueError(f"{settings.MODEL_NAME} doesn't support melody conditioning")
+    if duration > _model.max_duration:
+        raise ValueError(f"Melody conditioning is limited to {int(_model.max_duration)}s")
+
+    # The chroma comes from the feature cache, so the conditioning waveform
+    # only needs the reference's length, not its samples
+    info = sf.info(reference_path)
+    length = int(info.frames * _model.sample_rate / info.samplerate)
+    placeholder = torch.zeros(1, length)
+
+    _model.set_generation_params(duration=duration)
+    attributes, _ = _model._prepare_tokens_and_attributes([prompt], None, melody_wavs=[placeholder])
+    for attr in attributes:
+        attr.wav["self_wav"] = attr.wav["self_wav"]._replace(path=[reference_path], seek_time=[0.0])
+
+    tokens = _model._generate_tokens(attributes, None, _set_progress(progress))
+    return _model.generate_audio(tokens)
+
+
+def generate_continuation(
+    prompt: str,
+    duration: int,
+    reference_path: str,
+    progress: Optional[ProgressCallback] = None,
+) -> torch.Tensor:
+    """
+    Continue the last CONTINUATION_CONTEXT seconds of a reference file.
+    The returned clip starts with that context and is `duration` seconds long.
+
+    Returns:
+        Audio tensor of shape [1, C, T]
+    """
+    load_model()
+    if duration <= settings.CONTINUATION_CONTEXT:
+        raise ValueError(f"Continuations must be longer than {settings.CONTINUATION_CONTEXT}s")
+
+    codes = features.get_or_compute(reference_path, "codes", lambda: _encode(reference_path))
+    context = int(settings.CONTINUATION_CONTEXT * _model.frame_rate)
+    prompt_tokens = codes[None, :, -context:].to(_model.device)
+
+    _model.set_generation_params(duration=duration)
+    attributes, _ = _model._prepare_tokens_and_attributes([prompt], None)
+    tokens = _model._generate_tokens(attributes, prompt_tokens, _set_progress(progress))
+    return _model.generate_audio(tokens)
+
 
-    wav = _model.generate([prompt])
+def window_seconds() -> float:
+    """Length of the windows long tracks are generated in."""
+    return min(settings.LONG_FORM_WINDOW, load_model().max_duration)
+
+
+def is_long_form(duration: int) -> bool:
+    """Whether a track is too long for one window and is generated with generate_windows."""
+    return duration > window_seconds()
+
+
+def generate_windows(
+    prompt: str,
+    duration: int,
+    reference_path: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Iterator[tuple[int, int, torch.Tensor, float]]:
+    """
+    Generate a long track as a chain of windowed continuations.
+
+    The first window is generated from the prompt (or continues a reference
+    file, like generate_continuation); each later one continues the last
+    CONTINUATION_CONTEXT seconds of tokens of the window before it. Only one
+    window is held and decoded at a time, so memory doesn't grow with the
+    length of the track.
+
+    Args:
+        progress: Called with (generated_tokens, tokens_to_generate) across
+            the whole track
+
+    Yields:
+        (index, window count, audio of shape [1, C, T], overlap) per window,
+        where overlap is the number of seconds at its start that cover the
+        end of the previous window
+    """
+    load_model()
+    window = window_seconds()
+    context = settings.CONTINUATION_CONTEXT
+    if window <= context:
+        raise ValueError(f"LONG_FORM_WINDOW must be longer than CONTINUATION_CONTEXT ({context}s)")
+
+    lengths = [min(window, duration)]
+    covered = lengths[0]
+    while covered < duration:
+        lengths.append(min(window, context + duration - covered))
+        covered += lengths[-1] - context
+
+    context_frames = int(context * _model.frame_rate)
+    prompt_tokens = None
+    if reference_path is not None:
+        codes = features.get_or_compute(reference_path, "codes", lambda: _encode(reference_path))
+        prompt_tokens = codes[None, :, -context_frames:].to(_model.device)
+
+    # New tokens per window: a window's context tokens were generated by the previous one
+    new_tokens = [
+        int(length * _model.frame_rate) - (0 if index == 0 and prompt_tokens is None else context_frames)
+        for index, length in enumerate(lengths)
+    ]
+    total = sum(new_tokens)
+    attributes, _ = _model._prepare_tokens_and_attributes([prompt], None)
+
+    done = 0
+    for index, length in enumerate(lengths):
+        def window_progress(generated: int, to_generate: int, done: int = done, size: int = new_tokens[index]):
+            progress(done + int(size * generated / max(to_generate, 1)), total)
+
+        _model.set_generation_params(duration=length)
+        tokens = _model._generate_tokens(
+            attributes, prompt_tokens, _set_progress(window_progress if progress else None)
+        )
+        yield index, len(lengths), _model.generate_audio(tokens), 0.0 if index == 0 else float(context)
+
+        prompt_tokens = tokens[..., -context_frames:]
+        done += new_tokens[index]
+
+
+def generate_audio(
+    prompt: str,
+    duration: int,
+    reference_path: Optional[str] = None,
+    reference_mode: str = "melody",
+    progress: Optional[ProgressCallback] = None,
+) -> torch.Tensor:
+    """Generate a single clip, optionally conditioned on a reference file."""
+    print(f"Generating: {prompt}...")
 
-    audio_write(
-        output_path,
-        wav[0].cpu(),
-        _model.sample_rate,
-        strategy="loudness",
-        loudness_compressor=True,
-    )
+    if reference_path is None:
+        return generate([prompt], duration, progress=progress)
+    if reference_mode == "melody":
+        return generate_with_melody(prompt, duration, reference_path, progress)
+    return generate_continuation(prompt, duration, reference_path, progress)
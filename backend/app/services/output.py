@@ -0,0 +1,347 @@
+"""
+Output stage for generated audio.
+Copies a whole batch off the GPU in one transfer, loudness-normalizes it with
+vectorized NumPy and encodes the files on a thread pool, so the model worker
+can start the next job without waiting on disk I/O.
+"""
+
+import logging
+import math
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+import soundfile as sf
+import torch
+from scipy.signal import lfilter
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=settings.OUTPUT_WORKERS, thread_name_prefix="audio-writer")
+_pinned: Optional[torch.Tensor] = None
+_pinned_lock = threading.Lock()
+# Tracks being written window by window: path -> bytes that form a playable WAV so far
+_growing: dict[str, int] = {}
+_growing_lock = threading.Lock()
+# libsndfile command that rewrites the header for the frames written so far (sndfile.h);
+# soundfile doesn't export it, and SoundFile.flush() leaves the header alone
+SFC_UPDATE_HEADER_NOW = 0x1060
+
+# ITU-R BS.1770-4 gating parameters
+_BLOCK_SECONDS = 0.4
+_BLOCK_OVERLAP = 0.75
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+_CHANNEL_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+
+
+def to_numpy(wav: torch.Tensor) -> np.ndarray:
+    """
+    Copy a [B, C, T] batch to host memory as float32.
+
+    CUDA tensors go through a reusable pinned buffer in a single transfer.
+    The returned array may alias that buffer, so it is only valid until the
+    next call; normalize_loudness returns a fresh array.
+    """
+    global _pinned
+
+    wav = wav.detach().float()
+    if not wav.is_cuda:
+        return wav.numpy()
+
+    with _pinned_lock:
+        if _pinned is None or _pinned.numel() < wav.numel():
+            _pinned = torch.empty(wav.numel(), dtype=torch.float32, pin_memory=True)
+        host = _pinned[:wav.numel()].view(wav.shape)
+        host.copy_(wav, non_blocking=True)
+        torch.cuda.current_stream(wav.device).synchronize()
+        return host.numpy()
+
+
+def _biquad(audio: np.ndarray, b: list[float], a: list[float]) -> np.ndarray:
+    # Output is clamped like torchaudio's lfilter, which AudioCraft's loudness uses
+    return np.clip(lfilter(np.divide(b, a[0]), np.divide(a, a[0]), audio, axis=-1), -1.0, 1.0)
+
+
+def _k_weighting(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Apply the BS.1770 K-weighting filter (high shelf, then high-pass)."""
+    w0 = 2 * math.pi * 1500.0 / sample_rate
+    alpha = math.sin(w0) / 2 / (1 / math.sqrt(2))
+    A = 10 ** (4.0 / 40)
+    shelf_b = [
+        A * ((A + 1) + (A - 1) * math.cos(w0) + 2 * math.sqrt(A) * alpha),
+        -2 * A * ((A - 1) + (A + 1) * math.cos(w0)),
+        A * ((A + 1) + (A - 1) * math.cos(w0) - 2 * math.sqrt(A) * alpha),
+    ]
+    shelf_a = [
+        (A + 1) - (A - 1) * math.cos(w0) + 2 * math.sqrt(A) * alpha,
+        2 * ((A - 1) - (A + 1) * math.cos(w0)),
+        (A + 1) - (A - 1) * math.cos(w0) - 2 * math.sqrt(A) * alpha,
+    ]
+    audio = _biquad(audio, shelf_b, shelf_a)
+
+    w0 = 2 * math.pi * 38.0 / sample_rate
+    alpha = math.sin(w0) / 2 / 0.5
+    highpass_b = [(1 + math.cos(w0)) / 2, -1 - math.cos(w0), (1 + math.cos(w0)) / 2]
+    highpass_a = [1 + alpha, -2 * math.cos(w0), 1 - alpha]
+    return _biquad(audio, highpass_b, highpass_a)
+
+
+def integrated_loudness(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Measure the integrated loudness of every clip in a batch.
+
+    Args:
+        audio: Float array of shape [B, C, T]
+        sample_rate: Sample rate of the audio
+
+    Returns:
+        Loudness in LUFS, shape [B]
+    """
+    weighted = _k_weighting(audio, sample_rate)
+    length = weighted.shape[-1]
+    block = min(int(round(_BLOCK_SECONDS * sample_rate)), length)
+    step = max(int(round(block * (1 - _BLOCK_OVERLAP))), 1)
+    starts = np.arange(0, length - block + 1, step)
+
+    # Mean square of every gating block, from one cumulative sum: [B, C, N]
+    power = np.cumsum(np.square(weighted, dtype=np.float64), axis=-1)
+    power = np.concatenate([np.zeros(power.shape[:-1] + (1,)), power], axis=-1)
+    energy = (power[..., starts + block] - power[..., starts]) / block
+
+    weights = _CHANNEL_WEIGHTS[:audio.shape[1], None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        block_loudness = -0.691 + 10 * np.log10((weights * energy).sum(axis=1))  # [B, N]
+
+        gated = block_loudness > _ABSOLUTE_GATE
+        gated_energy = (energy * gated[:, None]).sum(-1) / gated.sum(-1)[:, None]
+        relative = -0.691 + 10 * np.log10((weights[:, 0] * gated_energy).sum(-1)) + _RELATIVE_GATE
+
+        gated &= block_loudness > relative[:, None]
+        gated_energy = (energy * gated[:, None]).sum(-1) / gated.sum(-1)[:, None]
+        return -0.691 + 10 * np.log10((weights[:, 0] * gated_energy).sum(-1))
+
+
+def loudness_gain(
+    audio: np.ndarray,
+    sample_rate: int,
+    target_lufs: float = -14.0,
+    energy_floor: float = 2e-3,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Measure the gain that brings each clip of a [B, C, T] batch to a target loudness.
+
+    Returns:
+        Linear gain per clip [B], and whether each clip is above the energy
+        floor and gets normalized at all [B]
+    """
+    loudness = integrated_loudness(audio, sample_rate)
+    rms = np.sqrt(np.square(audio).mean(axis=(1, 2)))
+    active = rms >= energy_floor
+    gain = np.where(active & np.isfinite(loudness), 10.0 ** ((target_lufs - loudness) / 20.0), 1.0)
+    return gain, active
+
+
+def apply_gain(audio: np.ndarray, gain: np.ndarray, active: np.ndarray) -> np.ndarray:
+    """Apply loudness_gain's result to a [B, C, T] batch, soft clipping the normalized clips."""
+    out = audio * gain[:, None, None].astype(np.float32)
+    return np.where(active[:, None, None], np.tanh(out), out)
+
+
+def normalize_loudness(
+    audio: np.ndarray,
+    sample_rate: int,
+    target_lufs: float = -14.0,
+    energy_floor: float = 2e-3,
+) -> np.ndarray:
+    """
+    Normalize each clip of a [B, C, T] batch to a target loudness with tanh soft clipping.
+    Matches AudioCraft's `strategy="loudness", loudness_compressor=True`; clips quieter
+    than the energy floor are left untouched.
+    """
+    return apply_gain(audio, *loudness_gain(audio, sample_rate, target_lufs, energy_floor))
+
+
+def _write(path: str, clip: np.ndarray, sample_rate: int) -> None:
+    sf.write(path, clip.T, sample_rate, subtype="PCM_16")
+
+
+def write_batch(
+    wav: torch.Tensor,
+    sample_rate: int,
+    paths: list[str],
+    then: Optional[Callable[[], dict]] = None,
+) -> Future:
+    """
+    Normalize a generated batch and write one WAV file per clip in the background.
+
+    Args:
+        wav: Audio of shape [B, C, T], on any device
+        sample_rate: Sample rate of the audio
+        paths: Output path for each clip, including the .wav extension
+        then: Called once every file is written; its return value becomes the result
+
+    Returns:
+        Future that resolves when all files are written (and `then` has run)
+    """
+    audio = normalize_loudness(to_numpy(wav), sample_rate, settings.LOUDNESS_TARGET)
+    writes = [_executor.submit(_write, path, clip, sample_rate) for path, clip in zip(paths, audio)]
+    return when_all(writes, then)
+
+
+def when_all(futures: list[Future], then: Optional[Callable[[], dict]] = None) -> Future:
+    """
+    Combine futures without blocking a thread on them.
+
+    Returns:
+        Future resolving to the result of `then` (or an empty dict) once every
+        future has finished, or failing with the first error
+    """
+    done: Future = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finish() -> None:
+        try:
+            for future in futures:
+                future.result()
+            done.set_result(then() if then else {})
+        except Exception as e:
+            logger.error(f"Output stage failed: {e}")
+            done.set_exception(e)
+
+    def on_done(_: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        finish()
+
+    if not futures:
+        finish()
+    for future in futures:
+        future.add_done_callback(on_done)
+    return done
+
+
+def _update_header(file: sf.SoundFile) -> bool:
+    """
+    Rewrite a file's header for the frames written so far.
+    This goes through soundfile internals; if a release no longer has them
+    the header is left to be written on close.
+
+    Returns:
+        Whether the header was updated
+    """
+    try:
+        command, handle, null = sf._snd.sf_command, file._file, sf._ffi.NULL
+    except AttributeError:
+        return False
+    command(handle, SFC_UPDATE_HEADER_NOW, null, 0)
+    return True
+
+
+def _crossfade_gains(length: int) -> tuple[np.ndarray, np.ndarray]:
+    """Equal-power fade-out and fade-in gains for a crossfade of `length` frames."""
+    # sin² + cos² = 1, so the summed power stays level across the join
+    angle = (np.arange(length, dtype=np.float32) + 0.5) / max(length, 1) * np.float32(np.pi / 2)
+    return np.cos(angle), np.sin(angle)
+
+
+def growing_size(path: str) -> Optional[int]:
+    """Get the playable size in bytes of a track still being written, or None if it isn't being written."""
+    with _growing_lock:
+        return _growing.get(path)
+
+
+class TrackWriter:
+    """
+    Write a long track window by window to a WAV file that grows on disk.
+
+    Consecutive windows overlap, and each one is joined to the track with an
+    equal-power crossfade that ends where its new material starts. The
+    loudness gain is measured on the first window and held for the rest of
+    the track, so the level doesn't jump between windows. The file (header
+    included) is flushed after every window, so it can be served while it
+    grows.
+    """
+
+    def __init__(self, path: str, sample_rate: int, crossfade: float):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.crossfade = int(crossfade * sample_rate)
+        self.frames = 0
+        self._file: Optional[sf.SoundFile] = None
+        self._gain: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self._tail: Optional[np.ndarray] = None  # [C, N] end of the track, held back for the next crossfade
+        self._stale_header = False
+
+    @property
+    def seconds(self) -> float:
+        """Length of the playable part of the track."""
+        return self.frames / self.sample_rate
+
+    def add(self, wav: torch.Tensor, overlap: float = 0.0) -> None:
+        """
+        Append a window.
+
+        Args:
+            wav: Window audio of shape [1, C, T], on any device
+            overlap: Seconds at the start of the window that cover the end of
+                the previous one
+        """
+        audio = np.array(to_numpy(wav)[0])
+        if self._file is None:
+            self._file = sf.SoundFile(self.path, "w", self.sample_rate, audio.shape[0], subtype="PCM_16")
+            self._gain = loudness_gain(audio[None], self.sample_rate, settings.LOUDNESS_TARGET)
+
+        overlap = min(int(round(overlap * self.sample_rate)), audio.shape[1])
+        if self._tail is not None:
+            fade = min(self._tail.shape[1], overlap)
+            start = overlap - fade
+            fade_out, fade_in = _crossfade_gains(fade)
+            kept = self._tail.shape[1] - fade
+            mixed = self._tail[:, kept:] * fade_out + audio[:, start:overlap] * fade_in
+            self._write(np.concatenate([self._tail[:, :kept], mixed], axis=1))
+            audio = audio[:, overlap:]
+
+        held = min(self.crossfade, audio.shape[1])
+        self._tail = audio[:, audio.shape[1] - held:]
+        self._write(audio[:, :audio.shape[1] - held])
+
+    def close(self) -> None:
+        """Write the held-back end of the track and finish the file."""
+        if self._tail is not None:
+            self._write(self._tail)
+            self._tail = None
+        if self._file is not None:
+            self._file.close()
+        with _growing_lock:
+            _growing.pop(self.path, None)
+
+    def abort(self) -> None:
+        """Stop writing and delete the partial file."""
+        if self._file is not None:
+            self._file.close()
+        with _growing_lock:
+            _growing.pop(self.path, None)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _write(self, audio: np.ndarray) -> None:
+        if not audio.shape[1]:
+            return
+        self._file.write(apply_gain(audio[None], *self._gain)[0].T)
+        # Players that trust the RIFF and data sizes would otherwise see an empty file
+        if not _update_header(self._file) and not self._stale_header:
+            logger.warning("Can't update WAV headers with this soundfile version; partial tracks play once finished")
+            self._stale_header = True
+        self._file.flush()
+        self.frames += audio.shape[1]
+        with _growing_lock:
+            _growing[self.path] = os.path.getsize(self.path)
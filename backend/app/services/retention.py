@@ -0,0 +1,132 @@
+"""
+Disk-budget retention for OUTPUT_DIR.
+Evicts the least recently used songs once the library outgrows its budget or
+maximum age, and compresses cold songs to FLAC. Favorite songs are never evicted.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import get_settings
+from app.database.repository import SongRepository
+from app.services import similarity, storage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_stats: dict = {
+    "usage_bytes": 0,
+    "budget_bytes": settings.STORAGE_BUDGET_MB * 1024 * 1024,
+    "files": 0,
+    "compressed_files": 0,
+    "evicted_songs": 0,
+    "last_run": None,
+}
+
+
+def get_stats() -> dict:
+    """Get storage statistics from the last retention run."""
+    return dict(_stats)
+
+
+def _cutoff(days: int) -> str:
+    """Format a cutoff N days ago as an SQLite CURRENT_TIMESTAMP string."""
+    moment = datetime.now(timezone.utc) - timedelta(days=days)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _evict(song: dict, files_by_song: dict[str, list[tuple[str, int]]]) -> Optional[int]:
+    """
+    Delete every file belonging to a song.
+
+    Returns:
+        Bytes freed, or None if a file is in use and the song was kept
+    """
+    files = files_by_song.get(song["filename"], [])
+    if not storage.evict([name for name, _ in files]):
+        return None
+    files_by_song.pop(song["filename"], None)
+    return sum(size for _, size in files)
+
+
+def run_once() -> dict:
+    """Apply age eviction, budget eviction and cold compression once."""
+    files = storage.scan_output_files()
+    files_by_song = defaultdict(list)
+    usage = 0
+    compressed = 0
+    for name, entry in files.items():
+        size = entry.stat().st_size
+        files_by_song[storage.source_filename(name)].append((name, size))
+        usage += size
+        if entry.name.endswith(".flac"):
+            compressed += 1
+
+    evicted = []
+
+    if settings.RETENTION_MAX_AGE_DAYS > 0:
+        for song in SongRepository.get_coldest(before=_cutoff(settings.RETENTION_MAX_AGE_DAYS)):
+            freed = _evict(song, files_by_song)
+            if freed is not None:
+                usage -= freed
+                evicted.append(song["id"])
+
+    budget = settings.STORAGE_BUDGET_MB * 1024 * 1024
+    if budget > 0 and usage > budget:
+        already = set(evicted)
+        for song in SongRepository.get_coldest():
+            if usage <= budget:
+                break
+            if song["id"] in already:
+                continue
+            freed = _evict(song, files_by_song)
+            if freed is not None:
+                usage -= freed
+                evicted.append(song["id"])
+        if usage > budget:
+            logger.warning("Storage budget exceeded by favorite songs alone")
+
+    if evicted:
+        SongRepository.delete_many(evicted)
+        similarity.remove(evicted)
+        logger.info(f"Evicted {len(evicted)} songs, library now {usage / 1024 / 1024:.0f} MB")
+
+    if settings.COMPRESS_AFTER_DAYS > 0:
+        cold = SongRepository.get_coldest(
+            before=_cutoff(settings.COMPRESS_AFTER_DAYS), include_favorites=True
+        )
+        newly_compressed = 0
+        for song in cold:
+            for name, _ in files_by_song.get(song["filename"], []):
+                if files[name].name.endswith(".wav"):
+                    saved = storage.compress(name)
+                    if saved is not None:
+                        usage -= saved
+                        newly_compressed += 1
+        if newly_compressed:
+            logger.info(f"Compressed {newly_compressed} cold files to FLAC")
+        compressed += newly_compressed
+
+    _stats.update(
+        usage_bytes=usage,
+        budget_bytes=budget,
+        files=sum(len(names) for names in files_by_song.values()),
+        compressed_files=compressed,
+        evicted_songs=_stats["evicted_songs"] + len(evicted),
+        last_run=time.time(),
+    )
+    return get_stats()
+
+
+async def retention_loop() -> None:
+    """Run retention in the background every RETENTION_INTERVAL seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(run_once)
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL)
@@ -0,0 +1,213 @@
+"""
+Similarity index over song embeddings.
+Keeps every analyzed song's embedding in a memory-mapped float32 matrix with
+a parallel song ID map, so "more like this" is one vectorized cosine search.
+Scores are centered on the library mean, which removes what every song
+shares (e.g. the overall spectral tilt) and spreads the similarities out.
+The song_features table holds the embeddings of record; the matrix is
+rebuilt from it on startup and kept up to date as songs come and go.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.database.repository import SongRepository
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.path.join(settings.OUTPUT_DIR, ".embeddings")
+EMBEDDING_DIM = 128
+INITIAL_CAPACITY = 1024
+
+# Seconds between checks for embeddings written by other processes (the backfill command)
+SYNC_INTERVAL = 60
+# Query rows scored at once, bounding the [queries, songs] score matrix
+QUERY_CHUNK = 64
+
+_lock = threading.RLock()
+_vectors: Optional[np.memmap] = None  # [capacity, EMBEDDING_DIM], unit length
+_ids: Optional[np.memmap] = None  # [capacity], 0 marks a free row
+_rows: dict[int, int] = {}
+_free: list[int] = []
+_size = 0  # Rows in use are all below this
+_centering: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None  # mean, row . mean, centered norms
+_synced_at: Optional[str] = None
+_synced_monotonic = 0.0
+
+
+def _open(capacity: int = 0) -> None:
+    """Map the index files, creating or growing them to at least `capacity` rows."""
+    global _vectors, _ids, _rows, _free, _size, _centering
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    vectors_path = os.path.join(INDEX_DIR, "vectors.f32")
+    ids_path = os.path.join(INDEX_DIR, "ids.i64")
+
+    current = os.path.getsize(ids_path) // 8 if os.path.exists(ids_path) else 0
+    capacity = max(capacity, current, INITIAL_CAPACITY)
+    if capacity > current:
+        for path, itemsize in ((vectors_path, 4 * EMBEDDING_DIM), (ids_path, 8)):
+            with open(path, "ab") as f:
+                f.truncate(capacity * itemsize)
+
+    if _vectors is not None:
+        _vectors.flush()
+        _ids.flush()
+    _vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, EMBEDDING_DIM))
+    _ids = np.memmap(ids_path, dtype=np.int64, mode="r+", shape=(capacity,))
+
+    used = np.flatnonzero(_ids)
+    _rows = {int(song_id): int(row) for song_id, row in zip(_ids[used], used)}
+    _size = int(used[-1]) + 1 if len(used) else 0
+    _free = sorted(set(range(_size)) - set(used.tolist()), reverse=True)
+    _centering = None
+
+
+def _ensure_open() -> None:
+    if _vectors is None:
+        _open()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def add(embeddings: dict[int, np.ndarray]) -> None:
+    """Insert or replace song embeddings (unit length, EMBEDDING_DIM floats)."""
+    global _size, _centering
+
+    with _lock:
+        _ensure_open()
+        new = [song_id for song_id in embeddings if song_id not in _rows]
+        needed = _size + max(len(new) - len(_free), 0)
+        if needed > len(_ids):
+            _open(max(needed, 2 * len(_ids)))
+
+        for song_id, vector in embeddings.items():
+            row = _rows.get(song_id)
+            if row is None:
+                row = _free.pop() if _free else _size
+                _size = max(_size, row + 1)
+                _rows[song_id] = row
+            # The vector is written before its ID so a crash never exposes a stale vector
+            _vectors[row] = vector
+            _ids[row] = song_id
+        _centering = None
+        _vectors.flush()
+        _ids.flush()
+
+
+def remove(song_ids: list[int]) -> None:
+    """Drop songs from the index."""
+    global _centering
+
+    with _lock:
+        _ensure_open()
+        for song_id in song_ids:
+            row = _rows.pop(song_id, None)
+            if row is not None:
+                _ids[row] = 0
+                _vectors[row] = 0.0
+                _free.append(row)
+                _centering = None
+        _ids.flush()
+
+
+def sync(full: bool = True) -> None:
+    """
+    Bring the index up to date with the embeddings stored in song_features.
+
+    Args:
+        full: Reconcile every song, dropping deleted ones; otherwise only pick
+            up embeddings stored since the last sync
+    """
+    global _synced_at, _synced_monotonic
+
+    started = _now()
+    with _lock:
+        _ensure_open()
+        since = None if full else _synced_at
+        stored = SongRepository.get_embeddings(since=since)
+        if full:
+            stale = set(_rows) - set(stored)
+            remove(list(stale))
+            missing = {song_id: blob for song_id, blob in stored.items() if song_id not in _rows}
+        else:
+            missing = stored
+        if missing:
+            add({song_id: np.frombuffer(blob, dtype=np.float32) for song_id, blob in missing.items()})
+        _synced_at = started
+        _synced_monotonic = time.monotonic()
+
+    if full:
+        logger.info(f"Similarity index ready: {len(_rows)} songs, added {len(missing)}, dropped {len(stale)}")
+
+
+def _center(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the library mean and each row's dot product with it and centered norm."""
+    global _centering
+
+    if _centering is None:
+        # Free rows are all zeros, so they don't add to the sum
+        mean = matrix.sum(axis=0) / max(len(_rows), 1)
+        offsets = matrix @ mean
+        norms = np.sqrt(np.maximum(1.0 - 2.0 * offsets + mean @ mean, 1e-12))
+        _centering = mean, offsets, norms
+    return _centering
+
+
+def search(song_ids: list[int], k: int = 10) -> list[Optional[list[tuple[int, float]]]]:
+    """
+    Find the most similar songs for a batch of songs.
+
+    Returns:
+        For each song, up to k (song ID, centered cosine similarity) pairs,
+        most similar first and excluding the song itself; None if the song
+        isn't indexed
+    """
+    if time.monotonic() - _synced_monotonic > SYNC_INTERVAL:
+        sync(full=False)
+
+    with _lock:
+        _ensure_open()
+        rows = [_rows.get(song_id) for song_id in song_ids]
+        indexed = [i for i, row in enumerate(rows) if row is not None]
+        results: list[Optional[list[tuple[int, float]]]] = [None] * len(song_ids)
+
+        matrix = np.asarray(_vectors[:_size])
+        ids = np.asarray(_ids[:_size])
+        free = ids == 0
+        mean, offsets, norms = _center(matrix)
+        count = min(k, len(_rows) - 1)
+        if count <= 0:
+            for i in indexed:
+                results[i] = []
+            return results
+
+        for start in range(0, len(indexed), QUERY_CHUNK):
+            chunk = indexed[start:start + QUERY_CHUNK]
+            query_rows = np.array([rows[i] for i in chunk])
+            # (x - m).(y - m) = x.y - x.m - y.m + m.m, without materializing centered rows
+            scores = matrix[query_rows] @ matrix.T  # [Q, N]
+            scores -= offsets[query_rows, None] + offsets[None, :] - mean @ mean
+            scores /= norms[query_rows, None] * norms[None, :]
+            scores[:, free] = -np.inf
+            scores[np.arange(len(chunk)), query_rows] = -np.inf
+
+            top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for i, neighbours, similarities in zip(chunk, ids[top], top_scores):
+                results[i] = [(int(n), float(s)) for n, s in zip(neighbours, similarities)]
+
+        return results
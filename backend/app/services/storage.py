@@ -0,0 +1,306 @@
+"""
+Output directory helpers.
+Resolves song filenames to sharded, optionally FLAC-compressed files in OUTPUT_DIR
+and maps each file back to the song it belongs to.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from typing import Iterable, Optional
+
+import soundfile as sf
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".flac")
+PROCESSED_PREFIX = "tickled_"
+
+# Suffixes added by the Hugging Face processing routes
+_DERIVED_SUFFIX = re.compile(r"_(?:stem_[^_]+|denoised)$")
+_SHARD_NAME = re.compile(r"^[0-9a-f]{2}$")
+
+# Guards the step that removes a WAV (thawing, compressing, evicting) against
+# requests that have just resolved it
+_thaw_lock = threading.Lock()
+# Song filename -> monotonic time it was last resolved
+_resolved: dict[str, float] = {}
+# Files resolved this recently are kept uncompressed and not evicted, so a
+# request isn't left holding a path that's gone before it opens the file
+IN_USE_SECONDS = 60
+
+
+def source_filename(filename: str) -> Optional[str]:
+    """
+    Get the raw song filename an output file was derived from.
+
+    Processed (tickled_*), stem (*_stem_*) and denoised (*_denoised) files
+    can be chained in any order, so prefixes and suffixes are stripped until
+    only the original generation is left.
+
+    Returns:
+        The raw filename, or None if the file is not an audio file
+    """
+    base, ext = os.path.splitext(filename)
+    if ext.lower() not in AUDIO_EXTENSIONS:
+        return None
+
+    while True:
+        stripped = _DERIVED_SUFFIX.sub("", base)
+        if stripped.startswith(PROCESSED_PREFIX):
+            stripped = stripped[len(PROCESSED_PREFIX):]
+        if stripped == base:
+            return f"{base}.wav"
+        base = stripped
+
+
+def shard_name(filename: str) -> str:
+    """
+    Get the name of the shard directory for a file.
+
+    Shards are keyed by a hash prefix of the source song, so a song and all
+    of its processed, stem and denoised files live in the same directory.
+    """
+    source = source_filename(filename) or filename
+    return hashlib.md5(source.encode()).hexdigest()[:2]
+
+
+def shard_dir(filename: str) -> str:
+    """Get the shard directory for a file."""
+    return os.path.join(settings.OUTPUT_DIR, shard_name(filename))
+
+
+def file_path(filename: str) -> str:
+    """Get the path a new output file should be written to."""
+    directory = shard_dir(filename)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def _flac_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.flac"
+
+
+def resolve(filename: str) -> Optional[str]:
+    """
+    Find the WAV file for a song filename.
+
+    Files compressed to FLAC by the retention manager are transparently
+    decompressed back to WAV, which blocks for the length of the transcode,
+    so async callers should run this in a worker thread. Files left in the
+    flat pre-sharding layout are still found.
+
+    Returns:
+        Path to the WAV file, or None if it does not exist
+    """
+    if os.path.basename(filename) != filename:
+        return None
+
+    # Marked before the existence check, so compress() sees it before removing the WAV
+    with _thaw_lock:
+        _resolved[filename] = time.monotonic()
+
+    path = os.path.join(shard_dir(filename), filename)
+    if os.path.exists(path):
+        return path
+
+    flac = _flac_path(path)
+    if os.path.exists(flac):
+        with _thaw_lock:
+            if not os.path.exists(path):
+                # The WAV only appears once complete, so it is never served
+                # half-written or left truncated beside its FLAC by a crash
+                tmp = f"{path}.tmp"
+                _transcode(flac, tmp)
+                os.replace(tmp, path)
+                os.remove(flac)
+                logger.info(f"Decompressed cold file: {filename}")
+        return path
+    # Decompressed by another request between the two checks
+    if os.path.exists(path):
+        return path
+
+    legacy = os.path.join(settings.OUTPUT_DIR, filename)
+    if os.path.isfile(legacy):
+        return legacy
+
+    return None
+
+
+def locate(filename: str) -> Optional[str]:
+    """
+    Find the stored file for a song filename without decompressing it.
+
+    Returns:
+        Path to the WAV or FLAC file, or None if it does not exist
+    """
+    if os.path.basename(filename) != filename:
+        return None
+
+    path = os.path.join(shard_dir(filename), filename)
+    for candidate in (path, _flac_path(path), os.path.join(settings.OUTPUT_DIR, filename)):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def remove(filename: str) -> None:
+    """Delete every stored copy of a file."""
+    path = os.path.join(shard_dir(filename), filename)
+    for candidate in (path, _flac_path(path), os.path.join(settings.OUTPUT_DIR, filename)):
+        if os.path.isfile(candidate):
+            os.remove(candidate)
+
+
+def in_use(filename: str) -> bool:
+    """Check whether a file was resolved within the last IN_USE_SECONDS."""
+    resolved = _resolved.get(filename)
+    if resolved is None:
+        return False
+    if time.monotonic() - resolved < IN_USE_SECONDS:
+        return True
+    _resolved.pop(filename, None)
+    return False
+
+
+def evict(filenames: list[str]) -> bool:
+    """
+    Delete every stored copy of a song's files, unless one is in use.
+
+    Returns:
+        Whether the files were deleted
+    """
+    with _thaw_lock:
+        if any(in_use(filename) for filename in filenames):
+            return False
+        for filename in filenames:
+            remove(filename)
+    return True
+
+
+def compress(filename: str) -> Optional[int]:
+    """
+    Compress a WAV file to FLAC in place, unless it is in use.
+
+    Returns:
+        Number of bytes saved, or None if the file wasn't compressed
+    """
+    path = os.path.join(shard_dir(filename), filename)
+    flac = _flac_path(path)
+    if not os.path.exists(path) or in_use(filename):
+        return None
+
+    size = os.path.getsize(path)
+    tmp = f"{flac}.tmp"
+    _transcode(path, tmp, format="FLAC")
+    with _thaw_lock:
+        if in_use(filename) or not os.path.exists(path):
+            os.remove(tmp)
+            return None
+        os.replace(tmp, flac)
+        os.remove(path)
+    return size - os.path.getsize(flac)
+
+
+def content_hash(path: str) -> str:
+    """
+    Hash the audio samples of a file, so a WAV and its FLAC copy match.
+
+    Returns:
+        SHA-256 hex digest of the 16-bit PCM samples, sample rate and channel count
+    """
+    digest = hashlib.sha256()
+    with sf.SoundFile(path) as reader:
+        digest.update(f"{reader.samplerate}:{reader.channels}:".encode())
+        for block in reader.blocks(blocksize=262144, dtype="int16"):
+            digest.update(block.tobytes())
+    return digest.hexdigest()
+
+
+def _transcode(src: str, dst: str, format: Optional[str] = None) -> None:
+    """Rewrite an audio file in another container, block by block."""
+    with sf.SoundFile(src) as reader:
+        subtype = "PCM_24" if reader.subtype in ("PCM_24", "PCM_32", "FLOAT", "DOUBLE") else "PCM_16"
+        with sf.SoundFile(
+            dst, "w", reader.samplerate, reader.channels,
+            subtype=subtype, format=format or "WAV",
+        ) as writer:
+            for block in reader.blocks(blocksize=65536, dtype="float32"):
+                writer.write(block)
+
+
+def _shard_dirs() -> list[os.DirEntry]:
+    with os.scandir(settings.OUTPUT_DIR) as entries:
+        return [e for e in entries if _SHARD_NAME.match(e.name) and e.is_dir()]
+
+
+def _scan_dir(path: str, files: dict[str, os.DirEntry]) -> None:
+    with os.scandir(path) as entries:
+        for entry in entries:
+            base, ext = os.path.splitext(entry.name)
+            if ext.lower() not in AUDIO_EXTENSIONS or not entry.is_file():
+                continue
+            name = f"{base}.wav"
+            # A WAV copy takes precedence over a FLAC one mid-compression
+            if name not in files or ext.lower() == ".wav":
+                files[name] = entry
+
+
+def scan_output_files(shards: Optional[Iterable[str]] = None) -> dict[str, os.DirEntry]:
+    """
+    List audio files in OUTPUT_DIR, one scandir per directory.
+
+    Args:
+        shards: Only scan these shard directories (and the top level)
+
+    Returns:
+        Mapping of song filename (always .wav) to the directory entry
+        holding its data, which may be a compressed .flac file
+    """
+    files: dict[str, os.DirEntry] = {}
+    _scan_dir(settings.OUTPUT_DIR, files)
+    if shards is None:
+        for shard in _shard_dirs():
+            _scan_dir(shard.path, files)
+    else:
+        for name in shards:
+            path = os.path.join(settings.OUTPUT_DIR, name)
+            if os.path.isdir(path):
+                _scan_dir(path, files)
+    return files
+
+
+def directory_fingerprint() -> dict[str, int]:
+    """
+    Get the modification time of each shard directory.
+
+    The top level is left out: SQLite creates and removes its -wal and -shm
+    files there, so its mtime says nothing about the audio files.
+    """
+    return {shard.name: shard.stat().st_mtime_ns for shard in _shard_dirs()}
+
+
+def migrate_flat_layout() -> int:
+    """
+    Move files from the flat pre-sharding layout into shard directories.
+
+    Returns:
+        Number of files moved
+    """
+    moved = 0
+    with os.scandir(settings.OUTPUT_DIR) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(AUDIO_EXTENSIONS) or not entry.is_file():
+                continue
+            os.replace(entry.path, file_path(entry.name))
+            moved += 1
+
+    if moved:
+        logger.info(f"Moved {moved} files into shard directories")
+    return moved
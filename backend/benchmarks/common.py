@@ -0,0 +1,67 @@
+"""
+Helpers shared by the benchmarks: latency summaries and throwaway libraries.
+"""
+
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Summarize latencies in seconds as p50/p95/p99/max in milliseconds."""
+    if not samples:
+        return {"requests": 0}
+    # quantiles needs two points; a single sample is every percentile
+    cuts = statistics.quantiles(samples * 2 if len(samples) == 1 else samples, n=100, method="inclusive")
+    return {
+        "requests": len(samples),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+def throughput(samples: list[float], elapsed: float, errors: int = 0) -> dict:
+    """Latency summary plus completed requests per second over the phase."""
+    return {
+        **percentiles(samples),
+        "errors": errors,
+        "requests_per_second": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def time_calls(call: Callable[[], object], iterations: int) -> list[float]:
+    """Time `iterations` sequential calls, in seconds each."""
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def git_commit() -> str:
+    """Commit the benchmarks ran against, so reports can be compared across commits."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@contextmanager
+def throwaway_library(**env: str) -> Iterator[str]:
+    """
+    Point the app at an empty temporary output directory.
+    Settings are read when app modules are first imported, so this must be
+    entered before importing anything from app.
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.environ.update({"OUTPUT_DIR": output_dir, **env})
+        yield output_dir
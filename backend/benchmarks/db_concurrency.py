@@ -0,0 +1,128 @@
+"""
+Database concurrency benchmark.
+
+Measures GET /songs latency on its own and while PATCH /songs/{id} and
+background record writes run, against a throwaway library. Run from the
+backend directory:
+
+    python -m benchmarks.db_concurrency [--songs 2000] [--seconds 10]
+
+Prints a JSON report with p50/p95/p99 latencies in milliseconds.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import redirect_stdout
+
+from benchmarks.common import percentiles, throwaway_library
+
+
+async def _read_load(client, seconds: float, concurrency: int) -> list[float]:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/songs", params={"limit": 50})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(reader() for _ in range(concurrency)))
+    return latencies
+
+
+async def _write_load(client, song_ids: list[int], stop: asyncio.Event, concurrency: int) -> list[float]:
+    latencies = []
+
+    async def writer():
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = await client.patch(
+                f"/songs/{random.choice(song_ids)}", json={"is_favorite": random.random() < 0.5}
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    return latencies
+
+
+def _record_load(repository, stop: threading.Event, created: list[int]) -> None:
+    """Insert songs from a plain thread, like the output stage recording generations."""
+    while not stop.is_set():
+        repository.create(prompt="benchmark", duration=15, filename=f"gen_{uuid.uuid4()}.wav")
+        created.append(1)
+        time.sleep(0.005)
+
+
+async def run(args) -> dict:
+    import httpx
+    from fastapi import FastAPI
+
+    from app.database import init_db, close_db, SongRepository
+    from app.routes import songs as songs_routes, output as output_routes
+
+    init_db()
+    SongRepository.create_many(
+        [(f"benchmark prompt {i}", 15, f"gen_{uuid.uuid4()}.wav") for i in range(args.songs)]
+    )
+    song_ids = [song["id"] for song in SongRepository.get_all(limit=args.songs)]
+
+    app = FastAPI()
+    app.include_router(songs_routes.router)
+    app.include_router(output_routes.router)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        baseline = await _read_load(client, args.seconds, args.readers)
+
+        stop = asyncio.Event()
+        stop_records = threading.Event()
+        created: list[int] = []
+        recorder = threading.Thread(target=_record_load, args=(SongRepository, stop_records, created))
+        recorder.start()
+        writes = asyncio.create_task(_write_load(client, song_ids, stop, args.writers))
+        started = time.perf_counter()
+        contended = await _read_load(client, args.seconds, args.readers)
+        stop.set()
+        stop_records.set()
+        write_latencies = await writes
+        recorder.join()
+        elapsed = time.perf_counter() - started
+
+    close_db()
+    return {
+        "songs": args.songs,
+        "readers": args.readers,
+        "writers": args.writers,
+        "reads_alone": percentiles(baseline),
+        "reads_during_writes": percentiles(contended),
+        "writes": percentiles(write_latencies),
+        "writes_per_second": round((len(write_latencies) + len(created)) / elapsed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=2000, help="Songs in the test library")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of each phase")
+    parser.add_argument("--readers", type=int, default=16, help="Concurrent /songs clients")
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent PATCH clients")
+    args = parser.parse_args()
+
+    # The app logs with print; keep stdout for the report
+    with throwaway_library(), redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
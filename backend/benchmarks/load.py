@@ -0,0 +1,167 @@
+"""
+Service load benchmark.
+
+Drives POST /generate, POST /process, GET /songs and GET /output at a given
+concurrency and reports throughput and latency for each. By default it runs
+the app in-process against a throwaway library with the fake model backend
+(MODEL_BACKEND=fake), so it needs no GPU or checkpoint. Run from the backend
+directory:
+
+    python -m benchmarks.load [--concurrency 8] [--generations 16] [--seconds 10]
+    python -m benchmarks.load --url http://localhost:6000   # a running server
+
+Prints a JSON report with requests per second and p50/p95/p99 latencies in
+milliseconds per endpoint.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager, nullcontext, redirect_stdout
+
+from benchmarks.common import git_commit, throughput, throwaway_library
+
+PROMPTS = [
+    "neurofunk bass with reese growl",
+    "halftime sub bass, sparse drums",
+    "liquid dnb pads and rolling bassline",
+    "dubstep wobble bass 140bpm",
+]
+
+
+async def _fixed_load(requests: list, concurrency: int) -> tuple[dict, list]:
+    """Send each request once, `concurrency` at a time, and collect the responses."""
+    latencies: list[float] = []
+    responses = []
+    errors = 0
+    pending = list(requests)
+
+    async def worker():
+        nonlocal errors
+        while pending:
+            send = pending.pop()
+            started = time.perf_counter()
+            response = await send()
+            if response.is_success:
+                latencies.append(time.perf_counter() - started)
+                responses.append(response)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return throughput(latencies, time.perf_counter() - started, errors), responses
+
+
+async def _timed_load(send, seconds: float, concurrency: int) -> dict:
+    """Repeat a request from `concurrency` clients for `seconds`."""
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await send()
+            if response.is_success:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return throughput(latencies, time.perf_counter() - started, errors)
+
+
+@asynccontextmanager
+async def _client(args):
+    import httpx
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+            yield client
+        return
+
+    from app.database import SongRepository
+    from app.main import app
+
+    # The lifespan loads the fake model, so generation timings exclude the load
+    async with app.router.lifespan_context(app):
+        await asyncio.to_thread(
+            SongRepository.create_many,
+            [(random.choice(PROMPTS), 15, f"gen_{uuid.uuid4()}.wav") for _ in range(args.songs)],
+        )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            while not (await client.get("/health")).json()["model_loaded"]:
+                await asyncio.sleep(0.05)
+            yield client
+
+
+async def run(args) -> dict:
+    report = {
+        "commit": git_commit(),
+        "target": args.url or "in-process (fake model)",
+        "concurrency": args.concurrency,
+        "clip_seconds": args.duration,
+    }
+
+    async with _client(args) as client:
+        def generate(prompt: str):
+            return lambda: client.post("/generate", json={"prompt": prompt, "duration": args.duration})
+
+        report["generate"], generated = await _fixed_load(
+            [generate(PROMPTS[i % len(PROMPTS)]) for i in range(args.generations)], args.concurrency
+        )
+        filenames = [response.json()["filename"] for response in generated]
+        if not filenames:
+            raise RuntimeError("No generation succeeded; nothing to process or serve")
+
+        def process(filename: str):
+            return lambda: client.post("/process", json={"filename": filename})
+
+        report["process"], _ = await _fixed_load([process(name) for name in filenames], args.concurrency)
+
+        report["songs"] = await _timed_load(
+            lambda: client.get("/songs", params={"limit": 50, "offset": random.randrange(0, max(args.songs, 1), 50)}),
+            args.seconds, args.concurrency,
+        )
+        report["output"] = await _timed_load(
+            lambda: client.get(f"/output/{random.choice(filenames)}"), args.seconds, args.concurrency
+        )
+
+    return report
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process app")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per endpoint")
+    parser.add_argument("--generations", type=int, default=16, help="Clips to generate (and then process)")
+    parser.add_argument("--duration", type=int, default=5, help="Seconds per generated clip")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of the /songs and /output phases")
+    parser.add_argument("--songs", type=int, default=1000, help="Extra songs in the in-process library")
+    parser.add_argument("--step-ms", type=float, default=10, help="Fake model decode time per token step")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    library = nullcontext() if args.url else throwaway_library(
+        MODEL_BACKEND="fake", FAKE_STEP_MS=str(args.step_ms)
+    )
+    # The app logs with print; keep stdout for the report
+    with library, redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Micro-benchmarks for the effect chain and the repository layer.
+
+Times effects.apply_effects on synthetic clips and the common SongRepository
+calls against a throwaway library of generated rows. Run from the backend
+directory:
+
+    python -m benchmarks.micro [--iterations 200] [--songs 10000]
+
+Prints a JSON report with p50/p95/p99 latencies in milliseconds per call.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from benchmarks.common import git_commit, percentiles, throwaway_library, time_calls
+
+SAMPLE_RATE = 32000
+
+
+def bench_effects(output_dir: str, clip_seconds: list[int], iterations: int) -> dict:
+    import soundfile as sf
+
+    from app.services import effects
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for seconds in clip_seconds:
+        source = os.path.join(output_dir, f"effects_{seconds}s.wav")
+        target = os.path.join(output_dir, f"tickled_effects_{seconds}s.wav")
+        sf.write(source, (0.3 * rng.standard_normal((seconds * SAMPLE_RATE, 2))).astype(np.float32), SAMPLE_RATE)
+
+        latencies = time_calls(lambda: effects.apply_effects(source, target), iterations)
+        summary = percentiles(latencies)
+        summary["realtime_factor"] = round(seconds / (summary["p50_ms"] / 1000), 1)
+        results[f"{seconds}s"] = summary
+    return results
+
+
+def bench_repository(songs: int, iterations: int) -> dict:
+    from app.database import SongRepository, init_db
+
+    init_db()
+    SongRepository.create_many(
+        [(f"benchmark prompt {i}", 15, f"gen_{uuid.uuid4()}.wav") for i in range(songs)]
+    )
+    rows = SongRepository.get_all(limit=songs)
+    ids = [song["id"] for song in rows]
+    filenames = [song["filename"] for song in rows]
+    SongRepository.save_features([
+        {
+            "song_id": song_id, "filename": filename, "bpm": random.uniform(80, 180), "key": "F minor",
+            "lufs": random.uniform(-20, -8), "peak_db": -1.0, "spectral_centroid": random.uniform(200, 4000),
+            "sub_bass": random.random(), "embedding": None,
+        }
+        for song_id, filename in zip(ids, filenames)
+    ])
+
+    calls = {
+        "get_by_id": lambda: SongRepository.get_by_id(random.choice(ids)),
+        "get_by_filename": lambda: SongRepository.get_by_filename(random.choice(filenames)),
+        "get_all_page": lambda: SongRepository.get_all(limit=50, offset=random.randrange(0, songs, 50)),
+        "get_all_filtered": lambda: SongRepository.get_all(limit=50, filters={"bpm_min": 170, "bpm_max": 176}),
+        "get_page": lambda: SongRepository.get_page(limit=50, offset=random.randrange(0, songs, 50)),
+        "count": lambda: SongRepository.count(),
+        "update": lambda: SongRepository.update(random.choice(ids), is_favorite=random.random() < 0.5),
+        "create": lambda: SongRepository.create("benchmark", 15, f"gen_{uuid.uuid4()}.wav"),
+        "create_many_100": lambda: SongRepository.create_many(
+            [("benchmark", 15, f"gen_{uuid.uuid4()}.wav") for _ in range(100)]
+        ),
+    }
+    return {name: percentiles(time_calls(call, iterations)) for name, call in calls.items()}
+
+
+def run(args, output_dir: str) -> dict:
+    from app.database import close_db
+
+    report = {
+        "commit": git_commit(),
+        "effects": bench_effects(output_dir, args.clip_seconds, args.effect_iterations),
+        "repository": bench_repository(args.songs, args.iterations),
+    }
+    close_db()
+    return report
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per repository operation")
+    parser.add_argument("--songs", type=int, default=10000, help="Songs in the test library")
+    parser.add_argument("--clip-seconds", type=int, nargs="+", default=[15, 60], help="Effect chain clip lengths")
+    parser.add_argument("--effect-iterations", type=int, default=10, help="Effect chain runs per clip length")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    # The app logs with print; keep stdout for the report
+    with throwaway_library() as output_dir, redirect_stdout(sys.stderr):
+        report = run(args, output_dir)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Point the app at a throwaway library before anything from app is imported;
+settings are read once, at import time.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+ROOT = tempfile.mkdtemp(prefix="resonator-tests-")
+os.environ["OUTPUT_DIR"] = os.path.join(ROOT, "library", "output")
+os.environ["MODEL_BACKEND"] = "fake"
+
+
+@pytest.fixture
+def library():
+    """An initialized database in the throwaway OUTPUT_DIR; yields the directory."""
+    from app.database import close_db, init_db
+
+    init_db()
+    yield os.environ["OUTPUT_DIR"]
+    close_db()
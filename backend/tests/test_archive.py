@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import tarfile
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.database import SongRepository
+from app.services import archive, storage
+from tests.conftest import ROOT
+
+
+def _wav_bytes(seed: int) -> bytes:
+    buffer = io.BytesIO()
+    noise = np.random.default_rng(seed).standard_normal((3200, 1)).astype(np.float32) * 0.1
+    sf.write(buffer, noise, 32000, format="WAV")
+    return buffer.getvalue()
+
+
+def _song(filename: str, files: list[str], processed_filename=None) -> dict:
+    return {
+        "id": 1, "prompt": "crafted", "duration": 1, "filename": filename,
+        "processed_filename": processed_filename, "custom_name": None, "is_favorite": 0,
+        "created_at": "2024-01-01 00:00:00", "updated_at": "2024-01-01 00:00:00", "files": files,
+    }
+
+
+def _archive(songs: list[dict], members: dict[str, bytes]) -> io.BytesIO:
+    """Build an archive the way export_stream lays it out, with arbitrary names."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        entries = {archive.MANIFEST_NAME: json.dumps({"version": archive.FORMAT_VERSION, "songs": songs}).encode()}
+        entries.update(members)
+        for name, data in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def _files_outside(library: str) -> set[str]:
+    """Files under the test root but outside OUTPUT_DIR."""
+    return {
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(ROOT)
+        if not directory.startswith(library)
+        for name in names
+    }
+
+
+@pytest.mark.parametrize("song", [
+    _song("../../evil.wav", ["../../evil.wav", "../../evil_pwned.sh"]),
+    _song("gen_a.wav", ["gen_a.wav", "../../evil_pwned.sh"]),
+    _song("gen_a.wav", ["gen_a.wav", "gen_a.sh"]),
+    _song("gen_a.wav", ["gen_a.wav", ".gen_a.wav"]),
+    _song("gen_a.wav", ["gen_a.wav", "tickled_gen_b.wav"]),
+    _song("gen_a.wav", ["gen_a.wav"], processed_filename="../tickled_gen_a.wav"),
+    _song("tickled_gen_a.wav", ["tickled_gen_a.wav"]),
+])
+def test_import_rejects_unsafe_names(library, song):
+    songs = SongRepository.count()
+    members = {f"{archive.AUDIO_DIR}/{name}": _wav_bytes(1) for name in song["files"]}
+
+    with pytest.raises(ValueError):
+        archive.import_stream(_archive([song], members))
+
+    assert _files_outside(library) == set()
+    assert SongRepository.count() == songs
+
+
+def test_import_skips_members_outside_the_manifest(library):
+    song = _song("gen_c.wav", ["gen_c.wav"])
+    members = {
+        f"{archive.AUDIO_DIR}/../../gen_c.wav": _wav_bytes(2),
+        f"{archive.AUDIO_DIR}/gen_c.wav": _wav_bytes(2),
+    }
+
+    result = archive.import_stream(_archive([song], members))
+
+    assert result["imported"] == 1
+    assert _files_outside(library) == set()
+    assert os.path.dirname(storage.resolve("gen_c.wav")) == storage.shard_dir("gen_c.wav")
+
+
+@pytest.fixture
+def client(library):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    # Without the lifespan: the library fixture has set up the database
+    return TestClient(app)
+
+
+def test_import_route_rejects_garbage_body(client):
+    response = client.post("/songs/import", content=b"not a tar archive" * 100)
+
+    assert response.status_code == 400
+
+
+def test_import_route_rejects_corrupt_audio(client, library):
+    songs = SongRepository.count()
+    song = _song("gen_d.wav", ["gen_d.wav"])
+    body = _archive([song], {f"{archive.AUDIO_DIR}/gen_d.wav": b"RIFF\0\0\0\0WAVEnot really audio"})
+
+    response = client.post("/songs/import", content=body.getvalue())
+
+    assert response.status_code == 400
+    assert "gen_d.wav" in response.json()["detail"]
+    assert storage.locate("gen_d.wav") is None
+    assert not [name for name in os.listdir(storage.shard_dir("gen_d.wav")) if name.startswith("gen_d")]
+    assert SongRepository.count() == songs
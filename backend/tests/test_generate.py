@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from app.database import SongRepository
+from app.routes import generate
+from app.services import jobs, musicgen, storage
+
+
+def test_failed_batch_leaves_no_files(library, monkeypatch):
+    calls = []
+
+    def fake_generate(prompts, duration, seed=None, progress=None):
+        calls.append(prompts)
+        if len(calls) == 2:
+            raise RuntimeError("out of memory")
+        return 0.1 * torch.randn(len(prompts), 1, 3200)
+
+    monkeypatch.setattr(generate.settings, "MAX_BATCH_SIZE", 2)
+    monkeypatch.setattr(musicgen, "generate", fake_generate)
+    monkeypatch.setattr(musicgen, "get_sample_rate", lambda: 32000)
+    written = []
+    file_path = storage.file_path
+
+    def record_path(filename):
+        written.append(filename)
+        return file_path(filename)
+
+    monkeypatch.setattr(storage, "file_path", record_path)
+    songs = SongRepository.count()
+
+    job = jobs.Job("generate_batch", run=lambda job: {})
+    with pytest.raises(RuntimeError):
+        generate._run_batch(job, ["a", "b", "c", "d"], seed=1, duration=1)
+
+    assert len(calls) == 2
+    assert len(written) == 2
+    assert all(storage.locate(name) is None for name in written)
+    assert SongRepository.count() == songs
@@ -0,0 +1,43 @@
+import threading
+
+from app.services import jobs
+
+
+def test_interactive_jobs_overtake_bulk_at_checkpoint():
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def bulk(job):
+        order.append("bulk:start")
+        started.set()
+        release.wait(5)
+        job.checkpoint()
+        order.append("bulk:end")
+        return {}
+
+    def record(name):
+        def run(job):
+            order.append(name)
+            return {}
+        return run
+
+    running = jobs.submit("generate", bulk, priority="bulk", cost=60)
+    assert started.wait(5)
+
+    background = jobs.submit("generate", record("background"), priority="background", cost=1)
+    long = jobs.submit("generate", record("long"), priority="interactive", cost=30)
+    short = jobs.submit("generate", record("short"), priority="interactive", cost=5)
+
+    assert jobs.position(running) is None
+    assert jobs.position(short) == 0
+    assert jobs.position(long) == 1
+    assert jobs.position(background) == 2
+
+    release.set()
+    for job in (running, long, short, background):
+        job.future.result(5)
+
+    assert order == ["bulk:start", "short", "long", "bulk:end", "background"]
+    assert running.status == "completed"
+    assert jobs.position(short) is None
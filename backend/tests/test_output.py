@@ -0,0 +1,55 @@
+import numpy as np
+import soundfile as sf
+import torch
+
+from app.services import output
+
+SAMPLE_RATE = 32000
+
+
+def _window(seconds: float) -> torch.Tensor:
+    return 0.1 * torch.randn(1, 2, int(seconds * SAMPLE_RATE))
+
+
+def test_track_writer_header_counts_every_window(tmp_path):
+    path = str(tmp_path / "long.wav")
+    writer = output.TrackWriter(path, SAMPLE_RATE, crossfade=0.5)
+
+    for index in range(3):
+        writer.add(_window(2.0), overlap=1.0 if index else 0.0)
+        assert sf.info(path).frames == writer.frames > 0
+        assert output.growing_size(path) == sf.info(path).frames * 4 + 44
+
+    writer.close()
+    assert sf.info(path).frames == writer.frames == 4 * SAMPLE_RATE
+    assert output.growing_size(path) is None
+
+
+def test_track_writer_falls_back_without_header_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(output, "_update_header", lambda file: False)
+    path = str(tmp_path / "long.wav")
+    writer = output.TrackWriter(path, SAMPLE_RATE, crossfade=0.5)
+
+    writer.add(_window(2.0))
+    writer.add(_window(2.0), overlap=1.0)
+    writer.close()
+
+    assert sf.info(path).frames == writer.frames == 3 * SAMPLE_RATE
+
+
+def test_integrated_loudness_of_reference_sine():
+    # BS.1770: a 1 kHz sine at -20 dBFS in one channel reads -23.0 LUFS
+    t = np.arange(10 * SAMPLE_RATE) / SAMPLE_RATE
+    sine = 0.1 * np.sin(2 * np.pi * 1000 * t)
+
+    loudness = output.integrated_loudness(sine[None, None], SAMPLE_RATE)
+
+    assert loudness.shape == (1,)
+    assert abs(loudness[0] - (-23.0)) <= 0.1
+
+
+def test_crossfade_gains_keep_power_level():
+    fade_out, fade_in = output._crossfade_gains(1000)
+
+    np.testing.assert_allclose(fade_out ** 2 + fade_in ** 2, 1.0, atol=1e-6)
+    assert fade_out[0] > 0.99 and fade_in[-1] > 0.99
@@ -0,0 +1,26 @@
+import numpy as np
+
+from app.services import similarity
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def test_search_finds_nearest_and_remove_hides_it(library):
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((20, similarity.EMBEDDING_DIM))
+    embeddings = {song_id: _unit(vector) for song_id, vector in enumerate(base, start=1000)}
+    # A near copy of the first song
+    embeddings[2000] = _unit(base[0] + 0.05 * rng.standard_normal(similarity.EMBEDDING_DIM))
+    similarity.sync()
+    similarity.add(embeddings)
+
+    [neighbours] = similarity.search([1000], k=3)
+    assert neighbours[0][0] == 2000
+    assert [score for _, score in neighbours] == sorted((score for _, score in neighbours), reverse=True)
+
+    similarity.remove([2000])
+    [neighbours] = similarity.search([1000], k=3)
+    assert 2000 not in [song_id for song_id, _ in neighbours]
+    assert similarity.search([2000]) == [None]
@@ -11,6 +11,7 @@ export default function App() {
     filteredTracks,
     currentTrack,
     isGenerating,
+    generationStatus,
     isProcessing,
     isAIProcessing,
     isLoading,
@@ -80,6 +81,7 @@ export default function App() {
 
           <StatusIndicator
             isGenerating={isGenerating}
+            generationStatus={generationStatus}
             isProcessing={isProcessing}
             isAIProcessing={isAIProcessing}
             error={error}
@@ -15,6 +15,12 @@ export async function generateMusic(prompt, duration = 15) {
   return response.data
 }
 
+// Queue a generation and return its job; follow it with watchJob
+export async function submitGeneration(prompt, duration = 15) {
+  const response = await client.post('/generate/jobs', { prompt, duration })
+  return response.data
+}
+
 export async function processMusic(filename) {
   const response = await client.post('/process', { filename })
   return response.data
@@ -60,3 +66,84 @@ export async function checkHFModelStatus(task) {
   const response = await client.get(`/hf/status/${task}`)
   return response.data
 }
+
+// Job progress feed - one WebSocket shared by every watched job
+const JOBS_SOCKET_URL = `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}${API_BASE}/ws/jobs`
+const RECONNECT_DELAY = 2000
+
+const jobWatchers = new Map()
+let jobsSocket = null
+
+function sendToJobsSocket(message) {
+  if (jobsSocket?.readyState === WebSocket.OPEN) {
+    jobsSocket.send(JSON.stringify(message))
+  }
+}
+
+function connectJobsSocket() {
+  if (jobsSocket) return
+
+  jobsSocket = new WebSocket(JOBS_SOCKET_URL)
+
+  jobsSocket.onopen = () => {
+    // Resubscribe after a reconnect; the server replies with each job's current state
+    sendToJobsSocket({ subscribe: [...jobWatchers.keys()] })
+  }
+
+  jobsSocket.onmessage = (message) => {
+    const data = JSON.parse(message.data)
+    const jobId = data.job?.id ?? data.job_id
+    jobWatchers.get(jobId)?.forEach((onEvent) => onEvent(data))
+  }
+
+  jobsSocket.onclose = () => {
+    jobsSocket = null
+    if (jobWatchers.size > 0) {
+      setTimeout(connectJobsSocket, RECONNECT_DELAY)
+    }
+  }
+}
+
+// Call onEvent with every {event, job} message for a job; returns an unwatch function
+export function watchJob(jobId, onEvent) {
+  if (!jobWatchers.has(jobId)) {
+    jobWatchers.set(jobId, new Set())
+    sendToJobsSocket({ subscribe: [jobId] })
+  }
+  jobWatchers.get(jobId).add(onEvent)
+  connectJobsSocket()
+
+  return () => {
+    const watchers = jobWatchers.get(jobId)
+    if (!watchers) return
+    watchers.delete(onEvent)
+    if (watchers.size === 0) {
+      jobWatchers.delete(jobId)
+      sendToJobsSocket({ unsubscribe: [jobId] })
+    }
+    if (jobWatchers.size === 0) {
+      jobsSocket?.close()
+    }
+  }
+}
+
+// Resolve with the finished job once it completes, or reject if it fails
+export function waitForJob(jobId, onUpdate) {
+  return new Promise((resolve, reject) => {
+    const unwatch = watchJob(jobId, ({ event, job }) => {
+      if (event === 'unknown') {
+        unwatch()
+        reject(new Error('Job not found'))
+        return
+      }
+      onUpdate?.(job)
+      if (job.status === 'completed') {
+        unwatch()
+        resolve(job)
+      } else if (job.status === 'failed') {
+        unwatch()
+        reject(new Error(job.error || 'Generation failed'))
+      }
+    })
+  })
+}
@@ -60,6 +60,10 @@ export function PromptInput({ onGenerate, isGenerating }) {
             <option value={15}>15s</option>
             <option value={20}>20s</option>
             <option value={30}>30s</option>
+            <option value={60}>1m</option>
+            <option value={120}>2m</option>
+            <option value={300}>5m</option>
+            <option value={600}>10m</option>
           </select>
         </div>
       </div>
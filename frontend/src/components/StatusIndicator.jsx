@@ -1,6 +1,23 @@
 import { FiLoader, FiCheckCircle, FiAlertCircle } from 'react-icons/fi'
 
-export function StatusIndicator({ isGenerating, isProcessing, isAIProcessing, error }) {
+function generationLabel(status) {
+  switch (status?.status) {
+    case 'queued':
+      return status.position != null ? `QUEUED (#${status.position + 1})...` : 'QUEUED...'
+    case 'running':
+      // Long tracks are generated in windows
+      if (status.partial) {
+        return `GENERATING BASS... ${Math.round(status.progress * 100)}% (WINDOW ${status.partial.window}/${status.partial.windows})`
+      }
+      return `GENERATING BASS... ${Math.round(status.progress * 100)}%`
+    case 'writing':
+      return 'FINALIZING...'
+    default:
+      return 'GENERATING BASS...'
+  }
+}
+
+export function StatusIndicator({ isGenerating, generationStatus, isProcessing, isAIProcessing, error }) {
   if (error) {
     return (
       <div className="status-indicator error">
@@ -14,7 +31,7 @@ export function StatusIndicator({ isGenerating, isProcessing, isAIProcessing, er
     return (
       <div className="status-indicator loading">
         <FiLoader className="icon spinning" />
-        <span>GENERATING BASS...</span>
+        <span>{generationLabel(generationStatus)}</span>
       </div>
     )
   }
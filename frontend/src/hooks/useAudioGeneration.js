@@ -1,6 +1,7 @@
 import { useState, useCallback, useEffect, useMemo } from 'react'
 import {
-  generateMusic,
+  submitGeneration,
+  waitForJob,
   processMusic,
   getAudioUrl,
   getSongs,
@@ -31,6 +32,7 @@ export function useAudioGeneration() {
   const [tracks, setTracks] = useState([])
   const [currentTrack, setCurrentTrack] = useState(null)
   const [isGenerating, setIsGenerating] = useState(false)
+  const [generationStatus, setGenerationStatus] = useState(null)
   const [isProcessing, setIsProcessing] = useState(false)
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState(null)
@@ -76,7 +78,9 @@ export function useAudioGeneration() {
     setError(null)
 
     try {
-      const result = await generateMusic(prompt, duration)
+      const job = await submitGeneration(prompt, duration)
+      setGenerationStatus(job)
+      await waitForJob(job.id, setGenerationStatus)
 
       // Reload songs to get the newly created one with proper ID
       const { songs } = await getSongs()
@@ -92,6 +96,7 @@ export function useAudioGeneration() {
       throw err
     } finally {
       setIsGenerating(false)
+      setGenerationStatus(null)
     }
   }, [])
 
@@ -212,6 +217,7 @@ export function useAudioGeneration() {
     filteredTracks,
     currentTrack,
     isGenerating,
+    generationStatus,
     isProcessing,
     isAIProcessing,
     isLoading,